@@ -1,11 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from wikidataintegrator import wdi_core
-import urllib.request
-from bs4 import BeautifulSoup
+import os
+import sys
+from urllib.parse import urlsplit, parse_qs
 import xlsxwriter
 
+# uses the HTTP client and cache of the pipeline scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Script"))
+from Http_functions import get_http_client
+from Cache_functions import SQLiteCache
+
 __author__ = "Riemer van der Vliet"
 __copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
 __credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
@@ -26,6 +31,23 @@ endpoint_url = "https://bioparts.wiki.opencura.com/query/sparql"
 # Output file name
 Out_name = "output"
 
+# Number of EC numbers per query, the queries are performed concurrently
+EC_page_size = 50
+
+# Maximum number of results per EC number
+EC_limit = 100
+
+# Sequence cache location and time to live in seconds, the sequences are cached by part name
+Seq_cache_loc = "sequence_cache.sqlite"
+Seq_cache_ttl = 60 * 60 * 24 * 30
+Seq_cache = None
+
+# Number of sequences retrieved together, the concurrent requests are limited per host by the HTTP client
+Seq_window = 100
+
+# Path to the registry XML file, if provided the sequences are read from this file instead of the iGEM registry
+Seq_dump_loc = None
+
 # Example data
 data = [[{'reaction': {'EC': '1.1.1.244', 'KEGG': 'R00605'}},
          {'reaction': {'EC': '1.14.18.3', 'KEGG': 'R09518'}},
@@ -65,14 +87,28 @@ data = [[{'reaction': {'EC': '1.1.1.244', 'KEGG': 'R00605'}},
          {'reaction': {'EC': '1.2.1.22', 'KEGG': 'R01446'}}]]
 
 
-def make_query(ID: str) -> str:
-    """Creates triple query using correct prefixes
+def make_query(IDs: list) -> str:
+    """Creates triple query using correct prefixes, a subquery per EC number limits the results to EC_limit per EC
+    number
 
-    :param ID: Enzyme Commision number
+    :param IDs: list of Enzyme Commision numbers
 
-    :return: query with EC number
+    :return: query with EC numbers
     """
 
+    subquery = """{
+        SELECT ?EC ?ID ?item ?type ?Seq
+        Where {
+            BIND(\"%s\" AS ?EC)
+            ?item p:P47 ?alignment.
+            ?alignment pq:P10 ?EC.
+            ?item wdt:P23 ?Seq.
+            ?item wdt:P27 ?x.
+            ?x rdfs:label ?type.
+            ?item wdt:P38 ?ID.
+        } LIMIT """ + str(EC_limit) + """
+    }"""
+
     query = """
 PREFIX wd: <http://bioparts.wiki.opencura.com/entity/>
 PREFIX wdt: <http://bioparts.wiki.opencura.com/prop/direct/>
@@ -83,15 +119,12 @@ PREFIX pq: <http://bioparts.wiki.opencura.com/prop/qualifier/>
 PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
 PREFIX bd: <http://www.bigdata.com/rdf#>
 
-SELECT ?ID ?item ?type ?Seq 
+SELECT ?EC ?ID ?item ?type ?Seq 
 Where {
-    ?item p:P47 ?alignment.
-    ?alignment pq:P10 \"""" + ID + """\".
-    ?item wdt:P23 ?Seq.
-    ?item wdt:P27 ?x.
-    ?x rdfs:label ?type.
-    ?item wdt:P38 ?ID.
-} LIMIT 100
+    """ + """
+    UNION
+    """.join(subquery % ID for ID in IDs) + """
+}
 """
     return query
 
@@ -104,7 +137,7 @@ def get_results(endpoint_url: str, query: str) -> dict:
 
     :return results: output of sparql query
     """
-    results = wdi_core.WDItemEngine.execute_sparql_query(query=query, endpoint=endpoint_url)
+    results = get_http_client().sparql_query(endpoint_url, query)
     return results
 
 
@@ -120,63 +153,148 @@ def parse_results(result: dict, vari: list) -> dict:
     # placeholder dictionary
     BB_dict = {}
 
-    # iterates variables in list
+    # iterates variables in list and fills dictionary, the sequence URL is replaced by the sequence by add_sequences()
     for item in vari:
+        BB_dict[item] = result[item]['value']
+    return BB_dict
 
-        # retrieves sequence
-        if item == "Seq":
-            BB_dict[item] = get_sequence(result[item]['value'])
 
-        # fills dictionary
-        else:
-            BB_dict[item] = result[item]['value']
-    return BB_dict
+def get_sequence_cache() -> SQLiteCache:
+    """Returns the cache of the sequences, opens it on first use.
+
+    :return: SQLiteCache keyed by part name
+    """
+    global Seq_cache
+    if Seq_cache is None:
+        Seq_cache = SQLiteCache(Seq_cache_loc, table="sequence", ttl=Seq_cache_ttl)
+    return Seq_cache
+
+
+def sequence_part(URL: str) -> str:
+    """Retrieves the part name from the sequence URL
+
+    :param URL: URL to iGEM biobrick registry sequence page
+
+    :return: part name
+    """
+    return parse_qs(urlsplit(URL).query).get("part", [URL])[0]
+
+
+def dump_sequences(dump_loc: str, names: set) -> dict:
+    """Reads the sequences of the parts from the registry XML file, one biobrick at a time
+
+    :param dump_loc: path to registry XML file
+    :param names: set of part names
+
+    :return: dictionary with key part name and value nucleotide sequence
+    """
+
+    # only needed when reading the registry XML file
+    from BB_parser_functions import BB_iterparse
+
+    sequences = {}
+    for element in BB_iterparse(dump_loc):
+        fields = {field.get("name"): "".join(field.itertext()) for field in element.findall("field")}
+        if fields.get("part_name") in names:
+            sequences[fields["part_name"]] = fields.get("sequence", "").strip()
+            if len(sequences) == len(names):
+                break
+    return sequences
+
+
+def get_sequences(URLs: list) -> dict:
+    """Retrieves the nucleotide sequences given URLs, from the cache, the registry XML file if provided or the iGEM
+    registry. Retrieved sequences are added to the cache.
+
+    :param URLs: list of URLs to iGEM biobrick registry sequence pages
+
+    :return: dictionary with key URL and value nucleotide sequence
+    """
+    cache = get_sequence_cache()
+    parts = {URL: sequence_part(URL) for URL in URLs}
+
+    # sequences of previous runs
+    sequences = {}
+    for name in set(parts.values()):
+        seq = cache.get(name, None)
+        if seq is not None:
+            sequences[name] = seq
+    missing = sorted(set(parts.values()) - set(sequences))
+
+    # sequences of the registry XML file
+    if missing and Seq_dump_loc is not None:
+        found = dump_sequences(Seq_dump_loc, set(missing))
+        cache.set_many(found)
+        sequences.update(found)
+        missing = [name for name in missing if name not in found]
+
+    # sequences of the iGEM registry, the page body is the plain sequence
+    URL_names = {URL: name for URL, name in parts.items() if name in missing}
+    URL_list = list(dict.fromkeys(URL_names))
+    for i in range(0, len(URL_list), Seq_window):
+        window = URL_list[i:i + Seq_window]
+        found = {URL_names[URL]: body.decode("utf8", "replace").strip()
+                 for URL, body in zip(window, get_http_client().fetch_many(window))}
+        cache.set_many(found)
+        sequences.update(found)
+
+    return {URL: sequences[name] for URL, name in parts.items()}
 
 
 def get_sequence(URL: str) -> str:
     """Retrieves nucleotide sequence given URL
 
-    :param URL: URL to iGEM biobrick registry biobrick page
+    :param URL: URL to iGEM biobrick registry sequence page
 
     :return seq: nucleotide sequence
     """
+    return get_sequences([URL])[URL]
 
-    # opens html
-    with urllib.request.urlopen(URL) as response:
-        html = response.read()
-
-    # retrieves sequence from HTML body
-    seq = str(BeautifulSoup(html, 'html.parser'))
 
-    # strips line endings
-    seq.rstrip()
-    seq = seq[1:]
+def add_sequences(output: list):
+    """Replaces the sequence URLs of the results by the nucleotide sequences, retrieved together
 
-    return seq
+    :param output: list of dictionaries with key variables and value corresponding result
+    """
+    URLs = [BB_dict["Seq"] for BB_dict in output if "Seq" in BB_dict]
+    sequences = get_sequences(URLs)
+    for BB_dict in output:
+        if "Seq" in BB_dict:
+            BB_dict["Seq"] = sequences[BB_dict["Seq"]]
 
 
-def queries(EC: str) -> list:
+def queries(EC_list: list) -> dict:
     """
-    gets results and splits in an output and variable list
+    gets results of all EC numbers, in pages of EC_page_size EC numbers, and splits these per EC number in an output
+    and variable list
 
-    :param EC: string EC number
+    :param EC_list: list of string EC numbers
 
-    :return: list of output list and list of variable list
+    :return: dictionary with key EC number and value list of output list and list of variable list
     """
 
-    # placeholder list
-    output = []
+    # placeholder dictionary, every EC number is present
+    output = {EC: [] for EC in EC_list}
+
+    # retrieves results of the pages concurrently
+    pages = [EC_list[i:i + EC_page_size] for i in range(0, len(EC_list), EC_page_size)]
+    results_pages = get_http_client().sparql_many(endpoint_url, [make_query(IDs=page) for page in pages])
 
-    # retrieves results
-    results_tot = get_results(endpoint_url, make_query(ID=EC))
+    # sets list of variables, the EC number is the sheet
+    vari = ["ID", "item", "type", "Seq"]
 
-    # sets list of variables
-    vari = results_tot['head']['vars']
+    # iterates results and fills the list output of the EC number
+    for results_tot in results_pages:
+        vari = [variable for variable in results_tot['head']['vars'] if variable != "EC"]
+        for result in results_tot['results']['bindings']:
+            EC_output = output[result['EC']['value']]
+            if len(EC_output) < EC_limit:
+                EC_output.append(parse_results(result, vari))
 
-    # iterates results_tot and fills list output
-    for result in results_tot['results']['bindings']:
-        output.append(parse_results(result, vari))
-    return [output, vari]
+    # retrieves the sequences of all EC numbers together
+    add_sequences([BB_dict for EC_output in output.values() for BB_dict in EC_output])
+
+    return {EC: [EC_output, vari] for EC, EC_output in output.items()}
 
 
 def mk_excel(workbook, vari: list, EC: str):
@@ -219,7 +337,7 @@ def write_excel(worksheet, output: dict):
 
 
 def from_data():
-    """Retrieves and parses data and checks for duplicate EC numbers in input file
+    """Retrieves and parses data and checks for duplicate EC numbers in input file, then queries all EC numbers
     """
 
     # placeholder for list
@@ -240,18 +358,18 @@ def from_data():
                 EC_list.append(EC)
                 print("checking for: ", EC, "in ", endpoint_url)
 
-                # preformes query and adds to workbook
-                main(workbook, EC)
+    # preformes query and adds to workbook
+    main(workbook, EC_list)
 
 
-def main(workbook, EC: str):
-    """Queries the EC number and adds to workbook
+def main(workbook, EC_list: list):
+    """Queries the EC numbers and adds a worksheet per EC number to workbook
 
     :param workbook: xlsxwriter file object
-    :param EC: Enzyme Commission number
+    :param EC_list: list of Enzyme Commission numbers
     """
-    [output, vari] = queries(EC)
-    write_excel(mk_excel(workbook, vari, EC), output)
+    for EC, [output, vari] in queries(EC_list).items():
+        write_excel(mk_excel(workbook, vari, EC), output)
 
 
 if __name__ == "__main__":
@@ -3,11 +3,18 @@
 
 from wikidataintegrator import wdi_core, wdi_login
 from WDI_value_functions import *
-from Parser_functions_V1 import *
-from Diamondblast_V2 import *
-from WDI_functions_V2 import prepare, get_item_by_name
+from BB_parser_functions import *
+from Diamondblast_functions import *
+from WDI_writer_functions import prepare, get_item_by_name
+from Store_functions import RecordStore
+from Http_functions import get_http_client
+from Assembly_functions import AssemblyGraph
+from Upload_functions import UploadExecutor
+from functools import partial
+from concurrent.futures import wait
 import copy
 import pickle
+import sys
 
 __author__ = "Riemer van der Vliet"
 __copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
@@ -20,65 +27,73 @@ __status__ = "Development"
 
 """
 The Add_assembly.py file is used to create linkage between BioParts item pages. The script adds the deep_u_list assembly
-to the Wikibase for each of the pickled dictionaries in the final directory. It uses the "contains" property on the 
+to the Wikibase for each of the dictionaries in the final record store. It uses the "contains" property on the 
 Wikibase to connect the files. 
 """
 
-F_directory = "../Parts/Final_pickle/"
-F2_directory = "../Parts/Final_pickle2/"
+F_store_loc = "../Parts/Final_parts.sqlite"
+F2_store_loc = "../Parts/Final_parts2.sqlite"
+# Item ID per part_id (property P11), stored after retrieval
+part_lookup_loc = "../Parts/part_lookup.pickle"
 endpoint_url = "https://bioparts.wiki.opencura.com/query/sparql"
 mediawiki_api_url = "https://bioparts.wiki.opencura.com/w/api.php"
 
 # list of item strings used by get_item_by_name() func.
 items = ["iGEM Parts Registry"]
 
+# Number of concurrent writes to the Wikibase
+upload_workers = 8
 
-def func(handle: str) -> bool:
+
+def func(WDI_dict: dict) -> bool:
     """Uploads assembly (property: "contains") to wikibase.
 
-    :param handle: pickled dictionary
+    :param WDI_dict: dictionary containing information of biobrick
     :return: True or False
     """
 
-    # creates WDI_dict from pickle file
-    WDI_dict = pickle.load(handle)
-    try:
-        string = WDI_dict['deep_u_list']
-    except KeyError:
+    if 'deep_u_list' not in WDI_dict:
         return True
 
-    # creates deep copy of reference
-    iGEM_ref = copy.deepcopy(create_iGEM_reference(WDI_dict['part name'], item_lookup, property_lookup))
+    if WDI_dict.get('part_id') is None:
+        logging.info(WDI_dict['part name'] + " has no part_id, skipping")
+        return True
 
-    # splits the deep_u_list into list of part_id
-    x = re.split("_", string)
+    # contained part_ids from the assembly graph, without the part itself
+    part_id_self = str(WDI_dict.get('part_id'))
+    x = [part_id for part_id in graph.components(part_id_self) if part_id != part_id_self]
 
-    # checks that no instance of self are passed
-    if len(x) <= 3:
-        logging.info(filename + " contains instance of self, skipping")
+    # checks that not only an instance of self is passed
+    if len(x) == 0:
+        logging.info(WDI_dict['part name'] + " contains instance of self, skipping")
         return True
-    else:
-        pass
+
+    # creates deep copy of reference
+    iGEM_ref = copy.deepcopy(create_iGEM_reference(WDI_dict['part name'], item_lookup, property_lookup))
 
     statements = []
 
-    # for part_id in deep list statement is appended
+    # for part_id in deep list statement is appended, the item IDs are looked up in part_lookup. Contained parts
+    # without item page are skipped, the other statements are written
+    missing = []
     for part_id in x:
-        if len(part_id) <= 1:
-            pass
+        y = part_lookup.get(part_id)
+        if y is None:
+            missing.append(part_id if part_id in graph.names else part_id + " (no record)")
         else:
-            y = get_and_parse_results(part_id)
-            if y is None:
-                return False
-            else:
-                statements.append(wdi_core.WDItemID(
-                    value=y,
-                    prop_nr=property_lookup['Contains'],
-                    references=[iGEM_ref],
-                    qualifiers=[datetime_qual]))
+            statements.append(wdi_core.WDItemID(
+                value=y,
+                prop_nr=property_lookup['Contains'],
+                references=[iGEM_ref],
+                qualifiers=[datetime_qual]))
+
+    if missing:
+        logging.warning(WDI_dict['part name'] + " contains part_ids without item page, skipped: " + ", ".join(missing))
+    if len(statements) == 0:
+        return True
 
     # finds parts page
-    parts_page_identifier = get_item_by_name(WDI_dict['part name'], endpoint_url)
+    parts_page_identifier = part_lookup.get(part_id_self) or get_item_by_name(WDI_dict['part name'], endpoint_url)
 
     # writes statements to parts page
     parts_page = wdi_core.WDItemEngine(
@@ -88,43 +103,92 @@ def func(handle: str) -> bool:
         mediawiki_api_url=mediawiki_api_url,
         sparql_endpoint_url=endpoint_url)
     parts_page.write(login_instance)
-    logging.info("part " + filename + " assembly is added")
+    logging.info("part " + WDI_dict['part name'] + " assembly is added")
     return True
 
 
-def make_query(part_id: str) -> str:
-    """Creates a SPARQL query
+def assembly_upload(WDI_dict: dict):
+    """Uploads the assembly using func(), raises an exception if the assembly is not added
 
-    :param part_id: biobrick identifier
+    :param WDI_dict: dictionary containing information of biobrick
+    """
+    if func(WDI_dict) is not True:
+        raise RuntimeError("part " + WDI_dict['part name'] + " assembly is NOT added")
+
+
+def assembly_completed(WDI_dict: dict):
+    """Records the completion of the part, the record is stored in F2_store before it is removed from F_store. A
+    part present in both stores with the same record is completed.
+
+    :param WDI_dict: dictionary containing information of biobrick
+    """
+    F2_store.put(WDI_dict)
+    F_store.delete(WDI_dict['part name'])
+
+
+def make_query(offset: int, page_size: int) -> str:
+    """Creates a SPARQL query of a page of the item IDs and part_ids
+
+    :param offset: number of results skipped
+    :param page_size: number of results
     :returns: SPARQL format query
 
     """
-    query = """PREFIX wd: <http://www.wikidata.org/entity/>
-        PREFIX wdt: <http://bioparts.wiki.opencura.com/prop/direct/>
-        PREFIX wikibase: <http://wikiba.se/ontology#>
-        PREFIX p: <http://bioparts.wiki.opencura.com/prop/>
-        PREFIX ps: <http://www.wikidata.org/prop/statement/>
-        PREFIX pq: <http://www.wikidata.org/prop/qualifier/>
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        PREFIX bd: <http://www.bigdata.com/rdf#>
-    
-    
-        SELECT ?item
+    query = """PREFIX wdt: <http://bioparts.wiki.opencura.com/prop/direct/>
+
+        SELECT ?item ?part_id
         Where {
-          ?item wdt:P11 \"""" + part_id + """\"; 
-        }"""
+          ?item wdt:P11 ?part_id .
+        } ORDER BY ?item LIMIT """ + str(page_size) + """ OFFSET """ + str(offset)
     return query
 
 
-def get_and_parse_results(part_id: str) -> str:
-    """performes the query using "make_query(param)" function and WDI package SPARQLwrapper
+def get_part_lookup(endpoint_url: str, page_size: int = 50000, pages: int = 4) -> dict:
+    """Retrieves the item IDs of all part_ids using paginated queries, several pages are queried concurrently. The
+    dictionary is stored in part_lookup_loc, which is used when the queries fail.
 
-    :param part_id: biobrick identifier
-    :return: wikibase item ID
+    :param endpoint_url: Wikibase SPARQL endpoint
+    :param page_size: number of results per query
+    :param pages: number of pages queried concurrently
+    :return: part_lookup dictionary with key part_id and value wikibase item ID
     """
-    results = wdi_core.WDItemEngine.execute_sparql_query(query=make_query(part_id), endpoint=endpoint_url)
-    for result in results["results"]["bindings"]:
-        return result['item']['value'][41:]
+
+    # placeholder for dictionary
+    part_lookup = {}
+    offset = 0
+    last = False
+
+    try:
+        while not last:
+            queries = [make_query(offset + page * page_size, page_size) for page in range(pages)]
+
+            # iterates results in page order, the first item of a part_id is kept
+            for results in get_http_client().sparql_many(endpoint_url, queries):
+                bindings = results["results"]["bindings"]
+                for result in bindings:
+                    part_lookup.setdefault(result['part_id']['value'], result['item']['value'].split("/")[-1])
+
+                # stops at the last page
+                if len(bindings) < page_size:
+                    last = True
+                    break
+
+            logging.info("Retrieved " + str(len(part_lookup)) + " part_ids")
+            offset += pages * page_size
+
+    # uses the part_lookup of a previous run
+    except Exception as error:
+        if not os.path.isfile(part_lookup_loc):
+            raise
+        logging.warning("retrieving part_ids failed, using " + part_lookup_loc + ": " + repr(error))
+        with open(part_lookup_loc, 'rb') as handle:
+            return pickle.load(handle)
+
+    # dumps object as pickle file
+    with open(part_lookup_loc, 'wb') as handle:
+        pickle.dump(part_lookup, handle, protocol=pickle.DEFAULT_PROTOCOL)
+
+    return part_lookup
 
 
 if __name__ == '__main__':
@@ -146,15 +210,56 @@ if __name__ == '__main__':
                                        mediawiki_api_url=mediawiki_api_url)
     datetime_qual = copy.deepcopy(create_datetime_qualifier(property_lookup))
 
-    handle = []
-
-    # iterates over the files in F_directory and checks if the actions have been performed.
-    for filename in os.listdir(F_directory):
-        if filename.endswith(".pickle"):
-            with open(F_directory + filename, "rb") as handle:
-                completed = func(handle)
-            if completed is True:
-                os.rename(F_directory + filename, F2_directory + filename)
-            else:
-                logging.warning("part " + filename + " assembly is NOT added")
-                pass
+    # retrieves the item IDs of all part_ids at once
+    part_lookup = get_part_lookup(endpoint_url)
+
+    # opens the record stores
+    F_store = RecordStore(F_store_loc)
+    F2_store = RecordStore(F2_store_loc)
+
+    # builds the assembly graph of the remaining and the completed records
+    graph = AssemblyGraph.from_store(F_store, F2_store)
+    logging.info("assembly graph " + graph.summary())
+    for cycle in graph.cycles():
+        logging.warning("parts contain each other, uploaded last: " + ", ".join(graph.names.get(part_id, part_id)
+                                                                               for part_id in cycle))
+
+    # part names level by level. The parts that can not be ordered, in a cycle or containing a part in a cycle, and
+    # the records without part_id are uploaded in a last level
+    levels = [[graph.names[part_id] for part_id in level] for level in graph.upload_levels()]
+    last = [graph.names[part_id] for part_id in graph.unordered() if graph.names[part_id] in F_store]
+    for name in last:
+        logging.warning("part " + name + " can not be ordered, uploaded last")
+    named = set(graph.names.values())
+    for name in F_store.names():
+        if name not in named:
+            logging.warning("part " + name + " has no part_id, uploaded last")
+            last.append(name)
+    levels.append(last)
+
+    # uploads concurrently, a part page is only written by one worker
+    executor = UploadExecutor(workers=upload_workers)
+
+    # iterates over the records in F_store level by level, contained parts first, and checks if the actions have been
+    # performed. A level is uploaded once the uploads of the previous level finished.
+    for level in levels:
+        futures = []
+        for name in level:
+            WDI_dict = F_store.get(name)
+            if WDI_dict is None:
+                continue
+
+            # removes records completed by an interrupted run
+            if F2_store.get(WDI_dict['part name']) == WDI_dict:
+                F_store.delete(WDI_dict['part name'])
+                continue
+
+            futures.append(executor.submit(WDI_dict['part name'], assembly_upload, WDI_dict,
+                                           callback=partial(assembly_completed, WDI_dict)))
+        wait(futures)
+
+    # waits for the uploads to finish
+    executor.shutdown()
+    logging.info(executor.summary())
+
+    logging.info(str(len(F_store)) + " parts remaining in " + F_store_loc)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from array import array
+from collections import deque
+import logging
+
+__author__ = "Riemer van der Vliet"
+__copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
+__credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Riemer van der Vliet"
+__email__ = "riemer.vandervliet@wur.nl"
+__status__ = "Development"
+
+"""
+Assembly graph used by the Add_assembly script. Connects the composite biobricks to the parts they contain, using the
+deep_u_list of the records in the record stores.
+"""
+
+logging.basicConfig(level=logging.INFO)
+
+
+def deep_u_split(string: str) -> list:
+    """Splits a deep_u_list into the part_ids it contains
+
+    :param string: deep_u_list, part_ids separated by underscores
+    :return: list of part_ids
+    """
+    if string is None:
+        return []
+    return [part_id for part_id in string.split("_") if part_id]
+
+
+class AssemblyGraph:
+    """Graph of the part_ids of the biobricks with an edge from each composite to each part it contains. The edges are
+    stored as compact arrays of node indices, in both directions.
+    """
+
+    def __init__(self, composites: dict, names: dict):
+        """
+        :param composites: dictionary with key part_id and value list of contained part_ids
+        :param names: dictionary with key part_id and value part name, of the parts present as record
+        """
+        self.names = names
+
+        # node index per part_id, parts without a record are added when contained
+        self.ids = []
+        self.index = {}
+        for part_id in list(names) + list(composites):
+            self._node(part_id)
+        for components in composites.values():
+            for part_id in components:
+                self._node(part_id)
+
+        # contained parts of each node, duplicates removed
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        for part_id in self.ids:
+            self.targets.extend(self.index[component] for component in dict.fromkeys(composites.get(part_id, ())))
+            self.offsets.append(len(self.targets))
+
+        # containing parts of each node
+        counts = [0] * (len(self.ids) + 1)
+        for target in self.targets:
+            counts[target + 1] += 1
+        for node in range(len(self.ids)):
+            counts[node + 1] += counts[node]
+        self.r_offsets = array('l', counts)
+        self.r_targets = array('l', [0] * len(self.targets))
+        position = list(counts)
+        for node in range(len(self.ids)):
+            for target in self.targets[self.offsets[node]:self.offsets[node + 1]]:
+                self.r_targets[position[target]] = node
+                position[target] += 1
+
+    def _node(self, part_id: str) -> int:
+        """Adds a node if not present
+
+        :param part_id: biobrick identifier
+        :return: node index
+        """
+        node = self.index.get(part_id)
+        if node is None:
+            node = self.index[part_id] = len(self.ids)
+            self.ids.append(part_id)
+        return node
+
+    @classmethod
+    def from_store(cls, *stores) -> "AssemblyGraph":
+        """Builds the graph from the deep_u_list of the records in the record stores
+
+        :param stores: RecordStore objects
+        :return: AssemblyGraph
+        """
+        composites = {}
+        names = {}
+        for store in stores:
+            for WDI_dict in store.scan():
+                part_id = WDI_dict.get('part_id')
+                if part_id is None:
+                    continue
+                part_id = str(part_id)
+                names[part_id] = WDI_dict['part name']
+                components = deep_u_split(WDI_dict.get('deep_u_list'))
+                if components:
+                    composites[part_id] = components
+        return cls(composites, names)
+
+    def _forward(self, node: int):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def _reverse(self, node: int):
+        return self.r_targets[self.r_offsets[node]:self.r_offsets[node + 1]]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, part_id: str) -> bool:
+        return part_id in self.index
+
+    def components(self, part_id: str) -> list:
+        """Returns the parts the part directly contains, including itself if it references itself
+
+        :param part_id: biobrick identifier
+        :return: list of part_ids
+        """
+        if part_id not in self.index:
+            return []
+        return [self.ids[node] for node in self._forward(self.index[part_id])]
+
+    def contains(self, part_id: str) -> set:
+        """Returns all parts the part contains, directly or through other parts
+
+        :param part_id: biobrick identifier
+        :return: set of part_ids
+        """
+        return self._reach(part_id, self._forward)
+
+    def used_in(self, part_id: str) -> set:
+        """Returns all parts that contain the part, directly or through other parts
+
+        :param part_id: biobrick identifier
+        :return: set of part_ids
+        """
+        return self._reach(part_id, self._reverse)
+
+    def _reach(self, part_id: str, edges) -> set:
+        """Breadth first search from the part
+
+        :param part_id: biobrick identifier
+        :param edges: function returning the neighbour nodes of a node
+        :return: set of part_ids reached, without the part itself
+        """
+        if part_id not in self.index:
+            return set()
+        start = self.index[part_id]
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            for node in edges(queue.popleft()):
+                if node not in seen:
+                    seen.add(node)
+                    queue.append(node)
+        seen.discard(start)
+        return {self.ids[node] for node in seen}
+
+    def self_references(self) -> list:
+        """Returns the parts that contain themselves
+
+        :return: list of part_ids
+        """
+        return [part_id for node, part_id in enumerate(self.ids) if node in self._forward(node)]
+
+    def missing(self) -> list:
+        """Returns the contained parts without a record
+
+        :return: list of part_ids
+        """
+        return [part_id for part_id in self.ids if part_id not in self.names]
+
+    def cycles(self) -> list:
+        """Finds the groups of parts that contain each other, directly or through other parts, using Tarjan's
+        strongly connected components algorithm. Self references are returned by self_references().
+
+        :return: list of lists of part_ids
+        """
+        number = [-1] * len(self.ids)
+        low = [0] * len(self.ids)
+        on_stack = [False] * len(self.ids)
+        stack = []
+        cycles = []
+        counter = 0
+
+        for root in range(len(self.ids)):
+            if number[root] != -1:
+                continue
+
+            # iterative depth first search, work holds the node and the position in its edges
+            work = [(root, 0)]
+            while work:
+                node, position = work.pop()
+                if position == 0:
+                    number[node] = low[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+
+                edges = self._forward(node)
+                descended = False
+                while position < len(edges):
+                    target = edges[position]
+                    position += 1
+                    if number[target] == -1:
+                        work.append((node, position))
+                        work.append((target, 0))
+                        descended = True
+                        break
+                    elif on_stack[target]:
+                        low[node] = min(low[node], number[target])
+                if descended:
+                    continue
+
+                # node finished, updates its parent
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                # node is the root of a component
+                if low[node] == number[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1:
+                        cycles.append([self.ids[member] for member in component])
+        return cycles
+
+    def upload_levels(self) -> list:
+        """Groups the parts with a record in levels, each part only contains parts of previous levels. The parts of a
+        level can be uploaded concurrently once the previous levels are uploaded. Self references are ignored. Parts in
+        a cycle, or containing a part in a cycle, can not be ordered and are left out.
+
+        :return: list of lists of part_ids
+        """
+
+        # number of distinct contained parts per node, self references excluded
+        remaining = [0] * len(self.ids)
+        for node in range(len(self.ids)):
+            remaining[node] = sum(1 for target in self._forward(node) if target != node)
+
+        # starts with the parts that contain no other parts, the next level holds the parts completed by a level
+        level = [node for node in range(len(self.ids)) if remaining[node] == 0]
+        levels = []
+        while level:
+            levels.append(level)
+            next_level = []
+            for node in level:
+                for container in self._reverse(node):
+                    if container != node:
+                        remaining[container] -= 1
+                        if remaining[container] == 0:
+                            next_level.append(container)
+            level = next_level
+
+        return [[self.ids[node] for node in level if self.ids[node] in self.names] for level in levels]
+
+    def upload_order(self) -> list:
+        """Orders the parts with a record so that contained parts come before the parts containing them, level by level
+        as created by upload_levels().
+
+        :return: list of part_ids
+        """
+        return [part_id for level in self.upload_levels() for part_id in level]
+
+    def unordered(self) -> list:
+        """Returns the parts with a record left out by upload_levels(), the parts in a cycle and the parts containing a
+        part in a cycle
+
+        :return: list of part_ids
+        """
+        ordered = set(self.upload_order())
+        return [part_id for part_id in self.ids if part_id in self.names and part_id not in ordered]
+
+    def summary(self) -> str:
+        """Returns a summary of the graph
+
+        :return: string with the number of parts, edges, missing parts, self references and cycles
+        """
+        return (str(len(self.names)) + " parts, " + str(len(self.targets)) + " contains edges, " +
+                str(len(self.missing())) + " contained parts without record, " + str(len(self.self_references())) +
+                " self references, " + str(len(self.cycles())) + " cycles")
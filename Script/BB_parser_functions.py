@@ -3,11 +3,18 @@
 
 from Bio.Alphabet.IUPAC import IUPACAmbiguousDNA as Nor_DNA
 import re
+import os
+import itertools
+import hashlib
+import copy
+import mmap
 from bs4 import BeautifulSoup
+from lxml import etree
 from Bio.Restriction import EcoRI, NheI, XbaI, SpeI, PstI, BglII, BamHI, XhoI, AgeI, AarI, RestrictionBatch
 from Bio.Seq import Seq
 import logging
-from SPARQLWrapper import SPARQLWrapper, JSON
+from Http_functions import get_http_client
+from Cache_functions import SQLiteCache
 
 __author__ = "Riemer van der Vliet"
 __copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
@@ -24,9 +31,49 @@ Functions used in the MAIN script related to biobrick parsing.
 
 logging.basicConfig(level=logging.INFO)
 
+# UniProt SPARQL endpoint and number of batch queries submitted together
+UP_sparql_url = "https://sparql.uniprot.org/sparql/"
+UP_window = 20
+
+# UniProt cache location, time to live in seconds and maximum number of entries
+UP_cache_loc = "../Parts/uniprot_cache.sqlite"
+UP_cache_ttl = 60 * 60 * 24 * 90
+UP_cache_size = 1000000
+UP_cache = None
+
+# Annotation cache location, annotations are stored per sequence hash
+AN_cache_loc = "../Parts/annotation_cache.sqlite"
+AN_cache = None
+
+# Alignment cache location, BLAST hits are stored per sequence hash and database version
+BL_cache_loc = "../Parts/alignment_cache.sqlite"
+BL_cache = None
+
+# Assembly standards and the restriction sites these are incompatible with
+AS_standards = [
+    ("RFC10", [EcoRI, XbaI, SpeI, PstI]),
+    # http://dspace.mit.edu/handle/1721.1/45138
+    ("RFC12", [EcoRI, SpeI, NheI, PstI]),
+    # https://dspace.mit.edu/bitstream/handle/1721.1/45139/BBFRFC12.txt?sequence=1&isAllowed=y
+    ("RFC21", [EcoRI, BglII, BamHI, XhoI]),
+    # https://dspace.mit.edu/bitstream/handle/1721.1/46747/BBFRFC21.pdf?sequence=1&isAllowed=y
+    ("RFC23", [EcoRI, XbaI, SpeI, PstI]),
+    # https://dspace.mit.edu/bitstream/handle/1721.1/32535/PhillipsSilverFusion.pdf?sequence=1&isAllowed=y
+    ("RFC25", [EcoRI, XbaI, AgeI, SpeI, PstI])
+    # https://dspace.mit.edu/bitstream/handle/1721.1/45140/BBF_RFC%2025.pdf?sequence=1&isAllowed=y
+]
+
+# Scanners created by RS_scanner() per list of enzymes
+RS_scanners = {}
+
+# DIAMOND tabular columns and the corresponding keys of the XML format
+BL_tabular_keys = {"sseqid": "Hit_id", "stitle": "Hit_def", "evalue": "Hsp_evalue", "bitscore": "Hsp_bit-score",
+                   "pident": "Hsp_identity", "length": "Hsp_align-len", "score": "Hsp_score", "slen": "Hit_len"}
 
-def RS_finder(value: str, RS: list) -> dict:
-    """Finds just the restriction sites and also where these are if present. Returns a dictionary with lists
+
+def RS_finder_Bio(value: str, RS: list) -> dict:
+    """Finds just the restriction sites and also where these are if present using the Biopython search of each
+    enzyme. Returns a dictionary with lists. Reference implementation of RS_finder().
 
     :param value: nucleotide sequence
     :param RS: list of restriction sites objects
@@ -50,19 +97,263 @@ def RS_finder(value: str, RS: list) -> dict:
     return RS_dict
 
 
-def create_fastafile(BB_name: str, value: str, fasta_loc: str):
-    """Creates a fasta file of all the different sequences. Also makes sure that the fasta format is complied with.
+def RS_finder(value: str, RS: list) -> dict:
+    """Finds just the restriction sites and also where these are if present. Returns a dictionary with lists.
+    All enzymes are searched in a single pass using RS_scan().
+
+    :param value: nucleotide sequence
+    :param RS: list of restriction sites objects
+
+    :return: RS_dict with present restriction sites as key and list of sites as value.
+    """
+    try:
+        return RS_from_scan(RS_scan(value, RS), RS)
+    except TypeError:
+        return {}
+
+
+def AS_finder(value: str) -> dict:
+    """Finds the restriction sites and assembly compatibilities of common restriction sites in iGEM. The restriction
+    sites of all assembly standards are searched in a single pass using RS_scan().
+
+    :param value: nucleotide sequence
+
+    :return: dictionary with key compatible or incompatible and list of assembly compatibilities as value.
+    """
+    return AS_from_scan(RS_scan(value, AS_enzymes()))
+
+
+def sequence_annotate(value: str, RS: list) -> dict or None:
+    """Finds the restriction sites and the assembly compatibilities of a nucleotide sequence. Both are derived from a
+    single RS_scan() of the sequence.
+
+    :param value: nucleotide sequence
+    :param RS: list of restriction sites objects
+
+    :return: dictionary with key "RS_dict", "Incompatible" and "Compatible" or None if no sequence is present
+    """
+
+    # test is a sequence is present
+    if value is None or len(value) <= 1:
+        return None
+
+    # searches the restriction sites and the sites of the assembly standards at once
+    scan = RS_scan(value, list(RS) + AS_enzymes())
+
+    annotation = {"RS_dict": RS_from_scan(scan, RS)}
+    for key, AS in AS_from_scan(scan).items():
+        annotation[key] = AS
+
+    return annotation
+
+
+def RS_scanner(RS: list) -> tuple:
+    """Creates the scanner of a list of enzymes used by RS_scan(). Contains a regular expression matching the start of
+    any recognition site on both strands and a lookup of recognition site to enzymes. Enzymes with ambiguous
+    recognition sites are searched by Biopython instead.
+
+    :param RS: list of restriction sites objects
+
+    :return: tuple of regular expression, lookup dictionary, list of site lengths, list of enzymes and list of
+        enzymes searched by Biopython
+    """
+    key = tuple(RS)
+    if key in RS_scanners:
+        return RS_scanners[key]
+
+    # placeholder for lookup and enzymes without duplicates
+    sites = {}
+    enzymes = list(dict.fromkeys(RS))
+    ambiguous = []
+
+    for enzyme in enzymes:
+        site = str(enzyme.site)
+        if not set(site).issubset(set("ACGT")):
+            ambiguous.append(enzyme)
+            continue
+
+        # recognition site on the current strand and, if not palindromic, on the complementary strand
+        sites.setdefault(site, []).append((enzyme, True))
+        if not enzyme.is_palindromic():
+            reverse = site[::-1].translate(str.maketrans("ACGT", "TGCA"))
+            sites.setdefault(reverse, []).append((enzyme, False))
+
+    # zero-width match at the start of any site, so overlapping sites are found
+    pattern = re.compile("(?=(?:" + "|".join(sorted(sites, key=len, reverse=True)) + "))") if sites else None
+    lengths = sorted(set(len(site) for site in sites))
+
+    RS_scanners[key] = (pattern, sites, lengths, enzymes, ambiguous)
+    return RS_scanners[key]
+
+
+def RS_scan(value: str, RS: list) -> dict:
+    """Searches the cutting sites of all enzymes in a single pass over the nucleotide sequence. Gives the same
+    cutting sites as the Biopython search of each enzyme on a linear sequence.
+
+    :param value: nucleotide sequence
+    :param RS: list of restriction sites objects
+
+    :return: dictionary with enzyme as key and list of cutting sites as value, for every enzyme
+    """
+    pattern, sites, lengths, enzymes, ambiguous = RS_scanner(RS)
+
+    # removes white space and digits and checks the characters, as Biopython does
+    seq = re.sub(r"[\s0-9]", "", value).upper()
+    if not set(seq).issubset(set("ABCDGHKMNRSTVWY")):
+        raise TypeError("Invalid character found in %s" % repr(seq))
+    length = len(seq)
+
+    # placeholders for cutting sites on the current and complementary strand
+    plus = {enzyme: [] for enzyme in enzymes}
+    minus = {enzyme: [] for enzyme in enzymes}
+
+    # iterates the start of every site, positions are 1-based
+    if pattern is not None:
+        for match in pattern.finditer(seq):
+            start = match.start()
+            for size in lengths:
+                if start + size > length:
+                    break
+                for enzyme, strand in sites.get(seq[start:start + size], ()):
+                    if strand:
+                        plus[enzyme].extend(enzyme._modify(start + 1))
+                    else:
+                        minus[enzyme].extend(enzyme._rev_modify(start + 1))
+
+    # placeholder for dictionary
+    scan = {}
+
+    for enzyme in enzymes:
+        if enzyme in ambiguous:
+            scan[enzyme] = enzyme.search(Seq(seq, Nor_DNA()))
+            continue
+
+        # removes the cutting sites outside of the sequence
+        results = plus[enzyme] if enzyme.is_palindromic() else sorted(plus[enzyme] + minus[enzyme])
+        results = list(itertools.dropwhile(lambda x: x <= 1, results))
+        scan[enzyme] = list(itertools.takewhile(lambda x: x <= length, results))
+
+    return scan
+
+
+def RS_from_scan(scan: dict, RS: list) -> dict:
+    """Creates the RS_dict from the result of RS_scan()
+
+    :param scan: dictionary with enzyme as key and list of cutting sites as value
+    :param RS: list of restriction sites objects
+
+    :return: RS_dict with present restriction sites as key and list of sites as value.
+    """
+    RS_dict = {}
+    for enzyme in RS:
+        if len(scan[enzyme]) > 0:
+            RS_dict[enzyme] = scan[enzyme]
+    return RS_dict
+
+
+def AS_from_scan(scan: dict) -> dict:
+    """Creates the assembly compatibility dictionary from the result of RS_scan()
+
+    :param scan: dictionary with enzyme as key and list of cutting sites as value, contains the AS_enzymes()
+
+    :return: dictionary with key compatible or incompatible and list of assembly compatibilities as value.
+    """
+
+    # placeholder for list objects
+    lst_incom = []
+    lst_comp = []
+
+    # an assembly standard is incompatible if any of its restriction sites is present
+    for name, enzymes in AS_standards:
+        if any(len(scan[enzyme]) > 0 for enzyme in enzymes):
+            lst_incom.append(name)
+        else:
+            lst_comp.append(name)
+
+    if len(lst_comp) < 1:
+        lst_comp = None
+    if len(lst_incom) < 1:
+        lst_incom = None
+
+    # creates final assembly compatibility dictionary
+    return {"Incompatible": lst_incom, "Compatible": lst_comp}
+
+
+def AS_enzymes() -> list:
+    """Returns the restriction sites of all assembly standards
+
+    :return: list of restriction sites objects without duplicates
+    """
+    return list(dict.fromkeys(enzyme for name, enzymes in AS_standards for enzyme in enzymes))
+
+
+def sequence_annotate_batch(batch: list, RS: list) -> list:
+    """Annotates a batch of sequences using sequence_annotate(). Runs in the worker processes of the annotation stage.
+    Annotations are memoized per sequence hash in the annotation cache, so duplicate sequences and sequences
+    annotated in previous runs are not searched again.
+
+    :param batch: list of biobrick part name and nucleotide sequence
+    :param RS: list of restriction sites objects
+
+    :return: list of annotations in the order of the batch, each part has its own copy
+    """
+    cache = get_annotation_cache()
+
+    # placeholder for annotations, for the new annotations to be cached and for the keys already annotated
+    annotations = []
+    new = {}
+    used = {}
+
+    for BB_name, value in batch:
+
+        # test is a sequence is present
+        if value is None or len(value) <= 1:
+            annotations.append(None)
+            continue
+
+        key = sequence_key(value, RS)
+
+        # duplicate sequences of the batch get a copy, so changing the annotation of one part leaves the others
+        if key in used:
+            annotations.append(copy.deepcopy(used[key]))
+            continue
+
+        annotation = cache.get(key)
+        if annotation is SQLiteCache.missing:
+            annotation = sequence_annotate(value, RS)
+            new[key] = copy.deepcopy(annotation)
+        used[key] = annotation
+        annotations.append(annotation)
+
+    # stores the new annotations at once
+    if new:
+        cache.set_many(new)
+
+    return annotations
+
+
+def sequence_key(value: str, RS: list) -> str:
+    """Creates the annotation cache key of a sequence, the SHA-1 of the sequence and of the enzymes searched.
 
-    :param BB_name: biobrick part name
     :param value: nucleotide sequence
-    :fasta_loc: location of fasta file
+    :param RS: list of restriction sites objects
+
+    :return: cache key
     """
+    seq = re.sub(r"[\s0-9]", "", value).upper()
+    enzymes = ",".join(str(enzyme) for enzyme in list(RS) + AS_enzymes())
+    return hashlib.sha1(seq.encode("utf8")).hexdigest() + ":" + hashlib.sha1(enzymes.encode("utf8")).hexdigest()[:8]
+
 
-    # appends to fasta file in FASTA format https://en.wikipedia.org/wiki/FASTA_format
-    fasta = open(fasta_loc, 'a+')
-    to_be_written = '>' + BB_name + '\n' + value + '\n'
-    fasta.write(to_be_written)
-    fasta.close()
+def get_annotation_cache() -> SQLiteCache:
+    """Returns the cache of the sequence annotations, opens it on first use in each process.
+
+    :return: SQLiteCache keyed by sequence_key()
+    """
+    global AN_cache
+    if AN_cache is None or AN_cache.pid != os.getpid():
+        AN_cache = SQLiteCache(AN_cache_loc, table="annotation")
+    return AN_cache
 
 
 def BB_func(children: dict, BB_unwanted: list) -> dict or bool:
@@ -91,11 +382,76 @@ def BB_func(children: dict, BB_unwanted: list) -> dict or bool:
     BB_part_id = children.find(attrs={"name": "part_id"}).get_text()
     BB_dict["part_id"] = BB_part_id
 
+    return BB_filter(BB_dict, BB_unwanted)
+
+
+def BB_iterparse(input_file, tag: str = "row"):
+    """Incrementally parses the XML file and yields one element at a time. Each element is cleared after use,
+    together with its already handled siblings, so memory stays flat regardless of the size of the file.
+
+    :param input_file: XML file, file path or file object opened in binary mode
+    :param tag: name of the element to be yielded
+
+    :return: generator of lxml elements
+    """
+
+    # parses only the closing tags of the requested elements
+    context = etree.iterparse(input_file, events=("end",), tag=tag, recover=True, huge_tree=True)
+
+    for event, element in context:
+        yield element
+
+        # frees the element and the previously handled siblings
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    del context
+
+
+def BB_func_element(element, BB_unwanted: list) -> dict or None:
+    """Does all the parsing and premature edits of the dictionary for an element yielded by BB_iterparse.
+    Produces the same dictionary as BB_func.
+
+    :param element: lxml "row" element from XML file
+    :param BB_unwanted: Unwanted items from XML file
+
+    :return: BB_dict dictionary of statements extracted from XML or None
+    """
+
+    # finds all fields of the row, the first field is skipped as in BB_func
+    fields = element.findall("field")
+
+    # placeholder for dictionary
+    BB_dict = {}
+
+    # fills the dictionary
+    for field in fields[1:]:
+        BB_dict[field.get("name")] = "".join(field.itertext())
+
+    # adds BB_part_id to dictionary
+    for field in fields:
+        if field.get("name") == "part_id":
+            BB_dict["part_id"] = "".join(field.itertext())
+            break
+
+    return BB_filter(BB_dict, BB_unwanted)
+
+
+def BB_filter(BB_dict: dict, BB_unwanted: list) -> dict or None:
+    """Filters out the incorrectly formatted biobricks, the unwanted items and the empty values.
+
+    :param BB_dict: dictionary of statements extracted from XML
+    :param BB_unwanted: Unwanted items from XML file
+
+    :return: BB_dict dictionary of statements extracted from XML or None
+    """
+
     # filters out the incorrectly formatted biobricks
     try:
         x = BB_dict["part_name"]
     except KeyError:
-        logging.info("skipped {part_id} " + BB_dict["part_id"] + " for now")
+        logging.info("skipped {part_id} " + str(BB_dict.get("part_id")) + " for now")
         return None
 
     # filters out the unwanted aspects and the empty values
@@ -109,8 +465,9 @@ def BB_func(children: dict, BB_unwanted: list) -> dict or bool:
     return BB_dict
 
 
-def AS_finder(value: str) -> dict:
-    """Finds the restriction sites and assembly compatibilities of common restriction sites in iGEM.
+def AS_finder_Bio(value: str) -> dict:
+    """Finds the restriction sites and assembly compatibilities of common restriction sites in iGEM using a Biopython
+    RestrictionBatch per assembly standard. Reference implementation of AS_finder().
 
     :param value: nucleotide sequence
 
@@ -198,27 +555,37 @@ def Author_name_sep(value: str) -> list:
     return x
 
 
-def blast_parser(blasted_file):
-    """Creates a soup item for the blasted_file and finds also the "iterations" in here.
+def blast_parser(blasted_file, unwanted: list) -> dict:
+    """Parses the blasted file once and creates an index of the BL_dict of each of the biobricks, keyed by the query
+    name. The "Iteration" elements are parsed one at a time and unwanted items are removed.
 
-    :param blasted_file: Blasted file in xml format
+    :param blasted_file: Blasted file in xml format, file path or file object opened in binary mode
+    :param unwanted: list of unwanted items
 
-    return: unparsed Bs4 object of "Iteration"
+    :return: BL_index with key biobrick part name and value BL_dict
     """
 
-    # creates Bs4 item from xml file
-    soup = BeautifulSoup(blasted_file, 'xml')
+    # placeholder for dictionary
+    BL_index = {}
+
+    # iterates through the iterations of the blasted file
+    for iteration in BB_iterparse(blasted_file, tag="Iteration"):
+        BB_name = iteration.findtext("Iteration_query-def")
+        hit = iteration.find("Iteration_hits/Hit")
 
-    # returns unparsed children of Bs4 file
-    unparsed = soup.find_all('Iteration')
-    return unparsed
+        # skips queries without a hit
+        if BB_name is None or hit is None:
+            continue
 
+        BL_index[BB_name.strip()] = blast_BB_parser(hit, unwanted)
 
-def blast_BB_parser(BB_name: str, unparsed, unwanted: list) -> dict:
-    """Creates the BL_dict for each of the biobricks and removes unwanted items
+    return BL_index
 
-    :param BB_name: biobrick  part name
-    :param unparsed: Bs4 object of "iteration"
+
+def blast_BB_parser(hit, unwanted: list) -> dict:
+    """Creates the BL_dict for a blast hit and removes unwanted items
+
+    :param hit: lxml element of "Hit"
     :param unwanted: list of unwanted items
 
     :return: BL_dict containing statements and items extracted from blast hit
@@ -226,35 +593,172 @@ def blast_BB_parser(BB_name: str, unparsed, unwanted: list) -> dict:
     # placeholder for dictionary
     BL_dict = {}
 
-    # tries to iterate the Bs4 object
-    try:
-        for children in unparsed:
-            if children.find(string=BB_name) is not None:
-                # extracts hits and iterates them
-                hits = children.find('Hit')
-                for line in hits:
-                    if line.name is not None:
-                        BL_dict[line.name] = line.get_text()
-                        if line.name == "Hit_hsps":
-
-                            # extracts children of Hsps to extract text.
-                            Hsps = line.children
-                            for Hsp in Hsps:
-                                if Hsp.name is not None:
-                                    CHsp = (Hsp.children)
-                                    for child in CHsp:
-                                        if child.name is not None:
-                                            BL_dict[child.name] = child.text
-                # creates copy of dictionary and removes unwanted items in unwanted
-                for key in BL_dict.copy():
-                    if key in unwanted:
-                        BL_dict.pop(key)
-    except TypeError:
-        pass
+    # extracts the items of the hit
+    for line in hit:
+        BL_dict[line.tag] = "".join(line.itertext())
+        if line.tag == "Hit_hsps":
+
+            # extracts children of Hsps to extract text.
+            for Hsp in line:
+                for child in Hsp:
+                    BL_dict[child.tag] = "".join(child.itertext())
+
+    # removes unwanted items in unwanted
+    for key in BL_dict.copy():
+        if key in unwanted:
+            BL_dict.pop(key)
 
     return BL_dict
 
 
+def blast_tabular_reader(blasted_file: str, columns: list):
+    """Streams the records of a blasted file in tabular format (outfmt 6). The file is memory-mapped and read line by
+    line, the records have the same keys as the BL_dict of the XML format.
+
+    :param blasted_file: location of blasted file in tabular format
+    :param columns: list of columns used when performing the blast
+
+    :return: generator of biobrick part name and BL_dict
+    """
+
+    with open(blasted_file, 'rb') as handle:
+
+        # an empty file can not be memory-mapped
+        if os.fstat(handle.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                record = line.rstrip(b"\r\n").decode("utf8", errors="ignore").split("\t")
+
+                # skips incomplete lines
+                if len(record) != len(columns):
+                    continue
+
+                # fills dictionary with XML keys
+                record = dict(zip(columns, record))
+                BL_dict = {}
+                for column, value in record.items():
+                    if column in BL_tabular_keys:
+                        BL_dict[BL_tabular_keys[column]] = value
+
+                # the title starts with the subject identifier, the definition follows it
+                if "sseqid" in record:
+                    BL_dict["Hit_accession"] = blast_accession_sep(record["sseqid"])
+                    if "stitle" in record and record["stitle"].startswith(record["sseqid"]):
+                        BL_dict["Hit_def"] = record["stitle"][len(record["sseqid"]):].strip()
+
+                yield record["qseqid"], BL_dict
+
+
+def blast_tabular_parser(blasted_file: str, columns: list, unwanted: list) -> dict:
+    """Parses the blasted file in tabular format into an index of the BL_dict of each of the biobricks, keyed by the
+    query name. Only the first hit of each query is kept.
+
+    :param blasted_file: location of blasted file in tabular format
+    :param columns: list of columns used when performing the blast
+    :param unwanted: list of unwanted items
+
+    :return: BL_index with key biobrick part name and value BL_dict
+    """
+
+    # placeholder for dictionary
+    BL_index = {}
+
+    for BB_name, BL_dict in blast_tabular_reader(blasted_file, columns):
+        if BB_name in BL_index:
+            continue
+
+        # removes unwanted items in unwanted
+        for key in BL_dict.copy():
+            if key in unwanted:
+                BL_dict.pop(key)
+
+        BL_index[BB_name] = BL_dict
+
+    return BL_index
+
+
+def blast_accession_sep(value: str) -> str:
+    """Separates the subject identifier and isolates the UniProt accession, "tr|A0A0|NAME" becomes "A0A0".
+
+    :param value: subject identifier
+
+    :return: UniProt accession
+    """
+    x = value.split("|")
+    if len(x) >= 2:
+        return x[1]
+    return value
+
+
+def get_uniprot_cache() -> SQLiteCache:
+    """Returns the cache of the UniProt cross-references and EC numbers, opens it on first use in each process.
+
+    :return: SQLiteCache keyed by "IDs:accession" and "EC:accession"
+    """
+    global UP_cache
+    if UP_cache is None or UP_cache.pid != os.getpid():
+        UP_cache = SQLiteCache(UP_cache_loc, table="uniprot", ttl=UP_cache_ttl, max_entries=UP_cache_size)
+    return UP_cache
+
+
+def get_alignment_cache() -> SQLiteCache:
+    """Returns the cache of the BLAST hits of previous runs, opens it on first use in each process.
+
+    :return: SQLiteCache keyed by alignment_key()
+    """
+    global BL_cache
+    if BL_cache is None or BL_cache.pid != os.getpid():
+        BL_cache = SQLiteCache(BL_cache_loc, table="alignment")
+    return BL_cache
+
+
+def alignment_key(value: str, version: str) -> str:
+    """Creates the alignment cache key of a sequence, the SHA-1 of the sequence and the database version.
+
+    :param value: nucleotide sequence
+    :param version: database version created by database_version()
+
+    :return: cache key
+    """
+    seq = re.sub(r"[\s0-9]", "", value).upper()
+    return hashlib.sha1(seq.encode("utf8")).hexdigest() + ":" + version
+
+
+def blast_cache_merge(BL_index: dict, aligned_keys: dict, BL_keys: dict) -> dict:
+    """Stores the hits of the current blast in the alignment cache and indexes the cached hits of the parts. The hits
+    are stored under the key of the sequence that was aligned, so a part whose sequence changed since the shards were
+    written never receives the hit of its previous sequence.
+
+    :param BL_index: index of BL_dict per biobrick part name of the current blast
+    :param aligned_keys: alignment cache key per biobrick part name of the sequences aligned in the current blast,
+        read from the shards. Sequences without a hit are stored as such
+    :param BL_keys: alignment cache key per biobrick part name, of the parts to be indexed
+
+    :return: index of BL_dict per biobrick part name
+    """
+    cache = get_alignment_cache()
+
+    # placeholder for new cache entries
+    new = {}
+    for BB_name, key in aligned_keys.items():
+        if new.get(key) is None:
+            new[key] = BL_index.get(BB_name)
+    cache.set_many(new)
+
+    # placeholder for index
+    index = {}
+    for BB_name, key in BL_keys.items():
+        BL_dict = new[key] if key in new else cache.get(key)
+        if BL_dict is not SQLiteCache.missing and BL_dict is not None:
+            index[BB_name] = BL_dict
+
+    logging.info("alignment cache " + str(cache.stats()) + ", " + str(len(new)) + " new alignments")
+
+    return index
+
+
 def SPARQLWrapper_EC(loc: str) -> str:
     """performs the query to the UniProt endpoint.
 
@@ -263,8 +767,11 @@ def SPARQLWrapper_EC(loc: str) -> str:
     :return EC: string
     """
 
-    # endpoint URL
-    sparql = SPARQLWrapper("https://sparql.uniprot.org/sparql/")
+    # checks the cache
+    cache = get_uniprot_cache()
+    EC = cache.get("EC:" + loc.split("/")[-1])
+    if EC is not SQLiteCache.missing:
+        return EC
 
     # sets query
     query = """
@@ -275,15 +782,16 @@ def SPARQLWrapper_EC(loc: str) -> str:
      }"""
 
     # performs query
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
+    results = get_http_client().sparql_query(UP_sparql_url, query)
 
-    # parses and iterates JSON
+    # parses and iterates JSON, the first EC number is kept
+    EC = None
     for result in results["results"]["bindings"]:
         EC = result["enzyme"]["value"][31:]
+        break
 
-        return EC
+    cache.set("EC:" + loc.split("/")[-1], EC)
+    return EC
 
 
 def SPARQLWrapper_IDs(loc: str) -> dict:
@@ -294,8 +802,11 @@ def SPARQLWrapper_IDs(loc: str) -> dict:
     :return: ID keys and ID values
     """
 
-    # endpoint URL
-    sparql = SPARQLWrapper("https://sparql.uniprot.org/sparql/")
+    # checks the cache
+    cache = get_uniprot_cache()
+    ID = cache.get("IDs:" + loc.split("/")[-1])
+    if ID is not SQLiteCache.missing:
+        return ID
 
     # placeholder for dictionary
     ID = {}
@@ -311,9 +822,7 @@ def SPARQLWrapper_IDs(loc: str) -> dict:
     """
 
     # performs query
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
+    results = get_http_client().sparql_query(UP_sparql_url, query)
 
     # parses and iterates JSON
     for result in results["results"]["bindings"]:
@@ -331,9 +840,141 @@ def SPARQLWrapper_IDs(loc: str) -> dict:
 
         ID[key] = value
 
+    cache.set("IDs:" + loc.split("/")[-1], ID)
     return ID
 
 
+def SPARQLWrapper_batch(accessions: list, Sparql_endpoint: str) -> dict:
+    """Finds identifiers, values and the EC number of several accessions in a single query to the UniProt database.
+
+    :param accessions: list of UniProt accessions
+    :param Sparql_endpoint: UniProt location prefix (URL)
+
+    :return: dictionary with key accession and value dictionary of ID keys, ID values and "EC number"
+    """
+    results = get_http_client().sparql_query(UP_sparql_url, uniprot_batch_query(accessions, Sparql_endpoint))
+    return uniprot_batch_parse(results, accessions, Sparql_endpoint)
+
+
+def uniprot_batch_query(accessions: list, Sparql_endpoint: str) -> str:
+    """Creates the query of the identifiers and EC number of several accessions
+
+    :param accessions: list of UniProt accessions
+    :param Sparql_endpoint: UniProt location prefix (URL)
+
+    :return: SPARQL query
+    """
+    query = """
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    PREFIX core:<http://purl.uniprot.org/core/>
+
+    SELECT ?protein ?ID ?enzyme
+    WHERE {
+    VALUES ?protein { """ + " ".join("<" + Sparql_endpoint + accession + ">" for accession in accessions) + """ }
+    { ?protein rdfs:seeAlso ?ID } UNION { ?protein core:enzyme ?enzyme }
+    }
+    """
+    return query
+
+
+def uniprot_batch_parse(results: dict, accessions: list, Sparql_endpoint: str) -> dict:
+    """Parses the results of uniprot_batch_query()
+
+    :param results: SPARQL JSON results
+    :param accessions: list of UniProt accessions of the query
+    :param Sparql_endpoint: UniProt location prefix (URL)
+
+    :return: dictionary with key accession and value dictionary of ID keys, ID values and "EC number"
+    """
+
+    # placeholder for dictionaries, every accession is present in the results
+    locs = {}
+    UP_index = {}
+    EC_index = {}
+    for accession in accessions:
+        locs[Sparql_endpoint + accession] = accession
+        UP_index[accession] = {}
+
+    # parses and iterates JSON
+    for result in results["results"]["bindings"]:
+        accession = locs.get(result["protein"]["value"])
+        if accession is None:
+            continue
+        ID = UP_index[accession]
+
+        # cross-reference, fills dictionary and eliminates duplicates
+        if "ID" in result:
+            result_ls = re.split("/", result["ID"]["value"][24:])
+            if len(result_ls) >= 2:
+                ID[result_ls[0]] = result_ls[1]
+
+        # EC number, the first is kept
+        if "enzyme" in result and accession not in EC_index:
+            EC_index[accession] = result["enzyme"]["value"][31:]
+
+    # adds EC number after the cross-references
+    for accession, EC in EC_index.items():
+        UP_index[accession]["EC number"] = EC
+
+    return UP_index
+
+
+def uniprot_batch_enrich(accessions: list, Sparql_endpoint: str, chunk_size: int = 250) -> dict:
+    """Retrieves the UniProt information of all accessions in chunks, the queries of the chunks are performed
+    concurrently. Accessions present in the UniProt cache are not queried.
+
+    :param accessions: list of UniProt accessions
+    :param Sparql_endpoint: UniProt location prefix (URL)
+    :param chunk_size: number of accessions per query
+
+    :return: dictionary with key accession and value dictionary of ID keys, ID values and "EC number"
+    """
+
+    # removes duplicates
+    accessions = list(dict.fromkeys(accessions))
+
+    # placeholder for dictionary and list of accessions not in the cache
+    UP_index = {}
+    uncached = []
+
+    # retrieves the cached accessions
+    cache = get_uniprot_cache()
+    for accession in accessions:
+        ID = cache.get("IDs:" + accession)
+        EC = cache.get("EC:" + accession)
+        if ID is SQLiteCache.missing or EC is SQLiteCache.missing:
+            uncached.append(accession)
+        else:
+            if EC is not None:
+                ID["EC number"] = EC
+            UP_index[accession] = ID
+
+    # performs a query per chunk, concurrently
+    chunks = [uncached[i:i + chunk_size] for i in range(0, len(uncached), chunk_size)]
+    if chunks:
+        logging.info("retrieving uniprot info on " + str(len(uncached)) + " accessions in " + str(len(chunks)) +
+                     " queries")
+
+    # the results are cached per window of chunks, so a failing query does not discard the previous windows
+    for i in range(0, len(chunks), UP_window):
+        window = chunks[i:i + UP_window]
+        queries = [uniprot_batch_query(chunk, Sparql_endpoint) for chunk in window]
+
+        # placeholder for new cache entries
+        new = {}
+        for chunk, results in zip(window, get_http_client().sparql_many(UP_sparql_url, queries)):
+            for accession, ID in uniprot_batch_parse(results, chunk, Sparql_endpoint).items():
+                UP_index[accession] = ID
+
+                # stores cross-references and EC number separately in the cache
+                ID = dict(ID)
+                new["EC:" + accession] = ID.pop("EC number", None)
+                new["IDs:" + accession] = ID
+        cache.set_many(new)
+
+    return UP_index
+
+
 def organism_sep(value: str) -> str:
     """Separates the blast hit and isolates the organism name.
 
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import pickle
+import threading
+import time
+import logging
+
+__author__ = "Riemer van der Vliet"
+__copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
+__credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Riemer van der Vliet"
+__email__ = "riemer.vandervliet@wur.nl"
+__status__ = "Development"
+
+"""
+Persistent key value cache used by the MAIN script functions. Stores pickled values in a SQLite file.
+"""
+
+logging.basicConfig(level=logging.INFO)
+
+
+class SQLiteCache:
+    """SQLite backed cache with a time to live, a maximum number of entries and hit and miss counters.
+    Several caches can share a file by using different tables.
+    """
+
+    # returned by get() when a key is not present and no default is given
+    missing = object()
+
+    def __init__(self, location: str, table: str = "cache", ttl: float = None, max_entries: int = None):
+        """
+        :param location: location of the SQLite file
+        :param table: name of the table holding the entries
+        :param ttl: time to live of an entry in seconds, None never expires
+        :param max_entries: maximum number of entries, the oldest are removed first. None is unbounded
+        """
+        self.location = location
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # process that opened the connection, connections are not shared between processes
+        self.pid = os.getpid()
+
+        # connection is shared between threads, access is guarded by the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(location, check_same_thread=False, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS " + table +
+                                " (key TEXT PRIMARY KEY, value BLOB, created REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS " + table + "_created ON " + table + " (created)")
+        self.connection.commit()
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+
+    def get(self, key: str, default=missing):
+        """Returns the cached value of the key
+
+        :param key: cache key
+        :param default: returned if the key is not present or expired
+
+        :return: cached value or default
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value, created FROM " + self.table + " WHERE key = ?",
+                                          (key,)).fetchone()
+
+            # removes expired entries
+            if row is not None and self.ttl is not None and row[1] < time.time() - self.ttl:
+                self.connection.execute("DELETE FROM " + self.table + " WHERE key = ?", (key,))
+                self.connection.commit()
+                self.entries -= 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value):
+        """Stores the value of the key, removes the oldest entries when the maximum is exceeded.
+
+        :param key: cache key
+        :param value: picklable object
+        """
+        self.set_many({key: value})
+
+    def set_many(self, values: dict):
+        """Stores the values of several keys in a single transaction, removes the oldest entries when the maximum is
+        exceeded.
+
+        :param values: dictionary of cache key and picklable object
+        """
+        rows = [(key, pickle.dumps(value, protocol=pickle.DEFAULT_PROTOCOL), time.time())
+                for key, value in values.items()]
+        with self.lock:
+            for row in rows:
+                present = self.connection.execute("SELECT 1 FROM " + self.table + " WHERE key = ?",
+                                                  (row[0],)).fetchone()
+                self.connection.execute("INSERT OR REPLACE INTO " + self.table +
+                                        " (key, value, created) VALUES (?, ?, ?)", row)
+                if present is None:
+                    self.entries += 1
+
+            # removes the oldest tenth when the size bound is exceeded
+            if self.max_entries is not None and self.entries > self.max_entries:
+                remove = self.entries - int(self.max_entries * 0.9)
+                self.connection.execute("DELETE FROM " + self.table + " WHERE key IN (SELECT key FROM " + self.table +
+                                        " ORDER BY created LIMIT ?)", (remove,))
+                self.entries -= remove
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """Returns the counters of the cache
+
+        :return: dictionary with hits, misses and entries
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": self.entries}
+
+    def close(self):
+        """Closes the SQLite connection
+        """
+        with self.lock:
+            self.connection.close()
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import os
+import mmap
+import shutil
+import subprocess
 import logging
 
 __author__ = "Riemer van der Vliet"
@@ -19,25 +22,285 @@ functions called by MAIN.py script. performs te blast.
 
 logging.basicConfig(level=logging.INFO)
 
+# Columns of the tabular (outfmt 6) output, read by blast_tabular_parser()
+BL_columns = ["qseqid", "sseqid", "stitle", "evalue", "bitscore"]
 
-def blast(database: str, fasta_loc: str, blasted_file: str):
+
+def blast(database: str, fasta_loc: str, blasted_file: str, outfmt: int = 5, columns: list = BL_columns):
     """
     Performs the blast given an '../Parts/input_fasta_file' and deletes this after.
 
     :param database: location of root database file
     :param fasta_loc: location of fasta file
     :param blasted_blasted file: location of output file (blasted file)
+    :param outfmt: DIAMOND output format, 5 (XML format) or 6 (tabular format)
+    :param columns: columns of the tabular format
     """
 
-    # performs the DIAMOND blast command. output is set to 5 (XML format), max-target-seqs is set 1 hit.
+    # sets output format, the tabular format uses the custom column list
+    if outfmt == 6:
+        output_format = '6 ' + ' '.join(columns)
+    else:
+        output_format = str(outfmt)
+
+    # performs the DIAMOND blast command. max-target-seqs is set 1 hit.
     os.system(
-        'diamond blastx -d ' + database + ' -q ' + fasta_loc + ' -o ' + blasted_file + ' --outfmt 5 --max-target-seqs 1')
+        'diamond blastx -d ' + database + ' -q ' + fasta_loc + ' -o ' + blasted_file + ' --outfmt ' + output_format +
+        ' --max-target-seqs 1')
     logging.info("done blast")
 
     # removes fasta file
     os.remove(fasta_loc)
 
 
+def blast_sharded(database: str, fasta_loc: str, blasted_file: str, shards: int = 4, threads: int = None,
+                  block_size: float = None, outfmt: int = 5, columns: list = BL_columns, keep_shards: bool = False):
+    """
+    Performs the blast given an '../Parts/input_fasta_file' split into shards, which are aligned by concurrent DIAMOND
+    processes. Finished shards are kept, so after a failure only the missing shards are aligned again. The shard
+    outputs are merged into the blasted file, after which the shards and the fasta file are removed. Shards written
+    directly by a FastaWriter are used as they are.
+
+    :param database: location of root database file
+    :param fasta_loc: location of fasta file, None if the shards are written by a FastaWriter
+    :param blasted_file: location of output file (blasted file)
+    :param shards: number of shards aligned concurrently
+    :param threads: total number of threads, divided over the shards. Defaults to the number of cores
+    :param block_size: DIAMOND block size in billions of sequence letters, None uses the DIAMOND default
+    :param outfmt: DIAMOND output format, 5 (XML format) or 6 (tabular format)
+    :param columns: columns of the tabular format
+    :param keep_shards: keeps the shards after merging, to be read by fasta_records() and removed by the caller
+    """
+    shard_directory = blast_shard_directory(blasted_file)
+    threads_per_shard = max(1, (threads or os.cpu_count() or 1) // shards)
+
+    # splits the fasta file, unless already split
+    if os.path.isfile(shard_directory + "shards.txt"):
+        with open(shard_directory + "shards.txt") as handle:
+            shards = int(handle.read())
+        logging.info("blast of " + str(shards) + " shards")
+    else:
+        fasta_split(fasta_loc, shard_directory, shards)
+
+    # shards with records, fewer records than shards leave empty shards
+    filled = [shard for shard in range(shards)
+              if os.path.getsize(shard_directory + "shard_" + str(shard) + ".fna") > 0]
+
+    # placeholder for running processes
+    processes = {}
+
+    # starts a DIAMOND process for each shard without output
+    for shard in filled:
+        shard_output = shard_directory + "shard_" + str(shard) + ".out"
+        if os.path.isfile(shard_output):
+            continue
+
+        command = ['diamond', 'blastx', '-d', database, '-q', shard_directory + "shard_" + str(shard) + ".fna",
+                   '-o', shard_output + ".tmp", '--max-target-seqs', '1', '--threads', str(threads_per_shard)]
+        if outfmt == 6:
+            command += ['--outfmt', '6'] + columns
+        else:
+            command += ['--outfmt', str(outfmt)]
+        if block_size is not None:
+            command += ['--block-size', str(block_size)]
+
+        logging.info("starting blast of shard " + str(shard))
+        processes[shard] = subprocess.Popen(command)
+
+    # waits for the processes, a shard is finished when its output is renamed
+    failed = []
+    for shard, process in processes.items():
+        if process.wait() == 0:
+            shard_output = shard_directory + "shard_" + str(shard) + ".out"
+            os.replace(shard_output + ".tmp", shard_output)
+            logging.info("done blast of shard " + str(shard))
+        else:
+            failed.append(shard)
+
+    if failed:
+        raise RuntimeError("blast failed for shards " + str(failed) + ", rerun to resume")
+
+    # merges the outputs
+    blast_merge([shard_directory + "shard_" + str(shard) + ".out" for shard in filled], blasted_file, outfmt)
+    logging.info("done blast")
+
+    # removes shards and fasta file
+    if not keep_shards:
+        shutil.rmtree(shard_directory)
+    if fasta_loc is not None and os.path.isfile(fasta_loc):
+        os.remove(fasta_loc)
+
+
+def blast_shard_directory(blasted_file: str) -> str:
+    """Returns the directory of the shards of the blasted file
+
+    :param blasted_file: location of output file (blasted file)
+
+    :return: directory of the shards
+    """
+    return blasted_file + ".shards/"
+
+
+class FastaWriter:
+    """Buffered writer of FASTA records directly into the shards aligned by blast_sharded(). The records are divided
+    round robin over the shards, the files are kept open until close().
+    """
+
+    def __init__(self, shard_directory: str, shards: int = 1, buffer_size: int = 1 << 20):
+        """
+        :param shard_directory: directory of the shards
+        :param shards: number of shards
+        :param buffer_size: write buffer size per shard in bytes
+        """
+        os.makedirs(shard_directory, exist_ok=True)
+        self.shard_directory = shard_directory
+        self.shards = shards
+        self.records = 0
+        self.handles = [open(shard_directory + "shard_" + str(shard) + ".fna", 'w', buffering=buffer_size)
+                        for shard in range(shards)]
+
+    def write(self, BB_name: str, value: str):
+        """Writes a record in FASTA format https://en.wikipedia.org/wiki/FASTA_format
+
+        :param BB_name: biobrick part name
+        :param value: nucleotide sequence
+        """
+        self.handles[self.records % self.shards].write('>' + BB_name + '\n' + value + '\n')
+        self.records += 1
+
+    def close(self):
+        """Closes the shards and marks them as finished, removes the shards if no record is written.
+        """
+        for handle in self.handles:
+            handle.close()
+
+        if self.records > 0:
+            fasta_shards_finish(self.shard_directory, self.shards)
+        else:
+            shutil.rmtree(self.shard_directory)
+
+
+def database_version(database: str) -> str:
+    """Creates a version string of the database, used to key alignments of previous runs.
+
+    :param database: location of root database file
+
+    :return: file name, size and modification time of the database or the file name if not present
+    """
+    name = os.path.basename(database)
+    if not os.path.isfile(database):
+        return name
+    stat = os.stat(database)
+    return name + ":" + str(stat.st_size) + ":" + str(int(stat.st_mtime))
+
+
+def fasta_split(fasta_loc: str, shard_directory: str, shards: int):
+    """Splits the fasta file into shards, the records are divided round robin.
+
+    :param fasta_loc: location of fasta file
+    :param shard_directory: directory of the shards
+    :param shards: number of shards
+    """
+    os.makedirs(shard_directory, exist_ok=True)
+
+    # opens a file per shard
+    handles = [open(shard_directory + "shard_" + str(shard) + ".fna", 'w') for shard in range(shards)]
+
+    # writes each record to the next shard, lines before the first header do not belong to a record
+    record = -1
+    with open(fasta_loc) as fasta:
+        for line in fasta:
+            if line.startswith(">"):
+                record += 1
+            elif record == -1:
+                if not line.strip():
+                    continue
+                for handle in handles:
+                    handle.close()
+                raise ValueError("fasta file " + fasta_loc + " does not start with a header")
+            handles[record % shards].write(line)
+
+    for handle in handles:
+        handle.close()
+
+    fasta_shards_finish(shard_directory, shards)
+
+
+def fasta_records(shard_directory: str):
+    """Reads the records of the shards
+
+    :param shard_directory: directory of the shards
+
+    :return: generator of tuples of biobrick part name and nucleotide sequence
+    """
+    with open(shard_directory + "shards.txt") as handle:
+        shards = int(handle.read())
+
+    for shard in range(shards):
+        BB_name = None
+        lines = []
+        with open(shard_directory + "shard_" + str(shard) + ".fna") as fasta:
+            for line in fasta:
+                if line.startswith(">"):
+                    if BB_name is not None:
+                        yield BB_name, "".join(lines)
+                    BB_name = line[1:].split()[0]
+                    lines = []
+                else:
+                    lines.append(line.strip())
+        if BB_name is not None:
+            yield BB_name, "".join(lines)
+
+
+def fasta_shards_finish(shard_directory: str, shards: int):
+    """Records the number of shards, marks the shards as finished and ready to be aligned.
+
+    :param shard_directory: directory of the shards
+    :param shards: number of shards
+    """
+    with open(shard_directory + "shards.txt.tmp", 'w') as handle:
+        handle.write(str(shards))
+    os.replace(shard_directory + "shards.txt.tmp", shard_directory + "shards.txt")
+
+
+def blast_merge(shard_outputs: list, blasted_file: str, outfmt: int = 5):
+    """Merges the outputs of the shards into a single blasted file. Tabular outputs are concatenated, of XML outputs
+    the iterations are combined in a single document.
+
+    :param shard_outputs: list of locations of shard outputs
+    :param blasted_file: location of output file (blasted file)
+    :param outfmt: DIAMOND output format, 5 (XML format) or 6 (tabular format)
+    """
+    start_tag = b"<BlastOutput_iterations>"
+    end_tag = b"</BlastOutput_iterations>"
+
+    # empty outputs can not be memory-mapped and are skipped
+    shard_outputs = [shard_output for shard_output in shard_outputs if os.path.getsize(shard_output) > 0]
+
+    with open(blasted_file + ".tmp", 'wb') as output:
+        for index, shard_output in enumerate(shard_outputs):
+            with open(shard_output, 'rb') as handle, \
+                    mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if outfmt == 6:
+                    output.write(mapped)
+                    continue
+
+                # header of the first shard, the iterations of each shard and the footer of the last shard
+                start = mapped.find(start_tag)
+                end = mapped.rfind(end_tag)
+                if start == -1 or end == -1:
+                    raise ValueError("no BlastOutput_iterations in " + shard_output + ", remove it to align again")
+                start += len(start_tag)
+                if index == 0:
+                    output.write(mapped[:start])
+                output.write(mapped[start:end])
+                if index == len(shard_outputs) - 1:
+                    output.write(mapped[end:])
+
+    # replaces the blasted file once complete
+    os.replace(blasted_file + ".tmp", blasted_file)
+
+
 if __name__ == '__main__':
     database = '/nvme1/riemer/uniprot/UniProt_TREMBL_2020-06.dmnd'
     fasta_loc = './fastafile.fna'
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from WDI_writer import WDI_statements
+from Store_functions import RecordStore
+import gzip
+import json
+import uuid
+import pickle
+import logging
+import os
+import sys
+from urllib.parse import quote
+
+__author__ = "Riemer van der Vliet"
+__copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
+__credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Riemer van der Vliet"
+__email__ = "riemer.vandervliet@wur.nl"
+__status__ = "Development"
+
+"""
+The Export_dump.py file exports the records of the final record store to a gzip compressed Wikibase JSON dump and a
+gzip compressed N-Triples file, to bulk load a Wikibase instance instead of writing every item page through the API.
+The statements are created by WDI_statements() of the WDI_writer. No network is used, the item and property IDs are
+read from the pickle files written by prepare() and save_label_index() of a previous run. Parts without an item page
+are numbered from the first free item ID, or from the item number provided: "python3 Export_dump.py [item number]"
+The dump is meant to load a fresh instance, loading it in an instance with item pages created after the label index
+was stored can give a part a second item ID. If the final records changed after the label index was stored, the item
+number has to be provided.
+"""
+
+logging.basicConfig(level=logging.INFO)
+
+# defines paths to objects
+F_store_loc = "../Parts/Final_parts.sqlite"
+item_lookup_loc = "../Parts/item_lookup.pickle"
+property_lookup_loc = "../Parts/property_lookup.pickle"
+label_lookup_loc = "../Parts/label_lookup.pickle"
+json_dump_loc = "../Parts/bioparts_dump.json.gz"
+nt_dump_loc = "../Parts/bioparts_dump.nt.gz"
+
+# concept URIs of the Wikibase
+entity_uri = "http://bioparts.wiki.opencura.com/entity/"
+direct_uri = "http://bioparts.wiki.opencura.com/prop/direct/"
+
+
+def load_pickle(loc: str, default=None):
+    """Loads a pickle file
+
+    :param loc: location of the pickle file
+    :param default: returned if the file is not present, otherwise the file is required
+
+    :return: unpickled object
+    """
+    try:
+        with open(loc, 'rb') as handle:
+            return pickle.load(handle)
+    except FileNotFoundError:
+        if default is None:
+            raise
+        return default
+
+
+def modified(loc: str) -> float:
+    """Returns the time a SQLite file was last modified, including its write-ahead log
+
+    :param loc: location of the SQLite file
+
+    :return: modification time in seconds, 0 if not present
+    """
+    times = [os.path.getmtime(path) for path in (loc, loc + "-wal") if os.path.isfile(path)]
+    return max(times, default=0)
+
+
+def entity_json(item_id: str, label: str, description: str, aliases: list, statements: list) -> dict:
+    """Creates the entity of an item page in the Wikibase JSON dump format
+
+    :param item_id: Wikibase item ID
+    :param label: English label
+    :param description: English description
+    :param aliases: English aliases
+    :param statements: list of Statement objects
+
+    :return: entity dictionary
+    """
+
+    # statements grouped by property, the statement IDs are reproducible
+    claims = {}
+    for index, statement in enumerate(statements):
+        claim = statement.get_json_representation()
+        claim["id"] = item_id + "$" + str(uuid.uuid5(uuid.NAMESPACE_URL, entity_uri + item_id + "/" + str(index)))
+        claims.setdefault(statement.prop_nr, []).append(claim)
+
+    entity = {"type": "item", "id": item_id,
+              "labels": {"en": {"language": "en", "value": label}},
+              "descriptions": {},
+              "aliases": {},
+              "claims": claims,
+              "sitelinks": {}}
+    if len(description) > 1:
+        entity["descriptions"]["en"] = {"language": "en", "value": description}
+    if aliases:
+        entity["aliases"]["en"] = [{"language": "en", "value": alias} for alias in aliases]
+    return entity
+
+
+def nt_literal(value: str, suffix: str = "@en") -> str:
+    """Creates an N-Triples literal
+
+    :param value: literal string
+    :param suffix: language tag or datatype of the literal
+
+    :return: N-Triples literal
+    """
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+               .replace("\t", "\\t"))
+    return '"' + escaped + '"' + suffix
+
+
+def snak_object(snak) -> str:
+    """Creates the N-Triples object of the value of a snak
+
+    :param snak: Snak object
+
+    :return: N-Triples object
+    """
+    if snak.datatype == "wikibase-item":
+        return "<" + entity_uri + snak.value + ">"
+    if snak.datatype == "url":
+        return "<" + quote(snak.value, safe=":/?#[]@!$&'()*+,;=%") + ">"
+    if snak.datatype == "time":
+        return nt_literal(snak.value.lstrip("+"), "^^<http://www.w3.org/2001/XMLSchema#dateTime>")
+    return nt_literal(str(snak.value), "")
+
+
+def entity_triples(item_id: str, label: str, description: str, aliases: list, statements: list) -> list:
+    """Creates the N-Triples of an item page, the label, description, aliases and the direct statements
+
+    :param item_id: Wikibase item ID
+    :param label: English label
+    :param description: English description
+    :param aliases: English aliases
+    :param statements: list of Statement objects
+
+    :return: list of N-Triples lines
+    """
+    subject = "<" + entity_uri + item_id + ">"
+    lines = [subject + " <http://www.w3.org/2000/01/rdf-schema#label> " + nt_literal(label) + " .\n"]
+    if len(description) > 1:
+        lines.append(subject + " <http://schema.org/description> " + nt_literal(description) + " .\n")
+    for alias in aliases:
+        lines.append(subject + " <http://www.w3.org/2004/02/skos/core#altLabel> " + nt_literal(alias) + " .\n")
+    for statement in statements:
+        lines.append(subject + " <" + direct_uri + statement.prop_nr + "> " + snak_object(statement.mainsnak) +
+                     " .\n")
+    return lines
+
+
+def export(store: RecordStore, item_lookup: dict, property_lookup: dict, label_lookup: dict,
+           first_id: int = None) -> int:
+    """Writes the records of the store to the JSON dump and the N-Triples file, one record at a time
+
+    :param store: record store of the final records
+    :param item_lookup: Wikibase item IDs.
+    :param property_lookup: Wikibase property IDs.
+    :param label_lookup: Wikibase item IDs by label of the present item pages
+    :param first_id: number of the first new item ID, defaults to the first number after the known item IDs
+
+    :return: number of exported item pages
+    """
+
+    # numbers new item pages after the known item pages
+    if first_id is None:
+        known = [int(item[1:]) for item in list(label_lookup.values()) + list(item_lookup.values())
+                 if item is not None and item[1:].isdigit()]
+        first_id = max(known, default=0) + 1
+    next_id = first_id
+
+    count = 0
+    with gzip.open(json_dump_loc, 'wt', encoding='utf8') as json_file, \
+            gzip.open(nt_dump_loc, 'wt', encoding='utf8') as nt_file:
+        json_file.write("[\n")
+
+        for WDI_dict in store.scan():
+            label = WDI_dict['part name']
+            description = WDI_dict.get('description', "")
+            [statements, aliases] = WDI_statements(WDI_dict, item_lookup, property_lookup)
+
+            # item ID of the present item page or a new item ID
+            item_id = label_lookup.get(label)
+            if item_id is None:
+                item_id = "Q" + str(next_id)
+                next_id += 1
+
+            # entities are separated by a comma and a line ending, as in the Wikibase JSON dumps
+            if count > 0:
+                json_file.write(",\n")
+            json_file.write(json.dumps(entity_json(item_id, label, description, aliases, statements),
+                                       ensure_ascii=False))
+            nt_file.writelines(entity_triples(item_id, label, description, aliases, statements))
+
+            count += 1
+            if count % 10000 == 0:
+                logging.info("exported " + str(count) + " parts")
+
+        json_file.write("\n]\n")
+
+    logging.info("exported " + str(count) + " parts, " + str(next_id - first_id) + " new item IDs from Q" +
+                 str(first_id) + " to " + json_dump_loc + " and " + nt_dump_loc)
+    return count
+
+
+if __name__ == '__main__':
+
+    # first new item number, optional
+    first_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+    # the first free item ID is only known if the label index was stored after the final records
+    if first_id is None and (not os.path.isfile(label_lookup_loc) or
+                             os.path.getmtime(label_lookup_loc) < modified(F_store_loc)):
+        logging.error("label index " + label_lookup_loc + " is missing or older than " + F_store_loc +
+                      ", items created since may be numbered again. Provide the first item number: "
+                      "python3 Export_dump.py [item number]")
+        sys.exit(1)
+
+    # item and property IDs of a previous run
+    item_lookup = load_pickle(item_lookup_loc)
+    property_lookup = load_pickle(property_lookup_loc)
+    label_lookup = load_pickle(label_lookup_loc, {})
+
+    export(RecordStore(F_store_loc), item_lookup, property_lookup, label_lookup, first_id)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import atexit
+import asyncio
+import threading
+import logging
+from urllib.parse import urlsplit
+import aiohttp
+
+__author__ = "Riemer van der Vliet"
+__copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
+__credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Riemer van der Vliet"
+__email__ = "riemer.vandervliet@wur.nl"
+__status__ = "Development"
+
+"""
+HTTP transport used for the SPARQL queries and web pages of the MAIN, Add_assembly and Query_Example scripts. Requests
+run on an asyncio event loop with keep-alive connection pooling, so many requests can be in flight at once. The
+functions can be called from regular (threaded) code.
+"""
+
+logging.basicConfig(level=logging.INFO)
+
+# Maximum number of concurrent requests per host, other hosts use limit_per_host
+host_limits = {"sparql.uniprot.org": 4}
+
+# Shared client, created by get_http_client()
+http_client = None
+http_lock = threading.Lock()
+
+
+class HttpClient:
+    """HTTP client running an asyncio event loop in a background thread. Connections are kept alive and reused, the
+    number of concurrent requests is limited per host. Failed requests (connection errors, timeouts, status 429 and 5xx)
+    are retried.
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 8, timeout: float = 300, retries: int = 3,
+                 host_limits: dict = None):
+        """
+        :param limit: maximum number of open connections
+        :param limit_per_host: maximum number of concurrent requests per host
+        :param timeout: timeout of a request in seconds
+        :param retries: number of retries of a failed request
+        :param host_limits: maximum number of concurrent requests of specific hosts, overrides limit_per_host
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.host_limits = host_limits or {}
+
+        # placeholder for semaphore per host, only used within the event loop
+        self.semaphores = {}
+
+        # process that created the client, the event loop thread is not shared between processes
+        self.pid = os.getpid()
+        self.closed = False
+
+        # runs the event loop in a background thread
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="HttpClient", daemon=True)
+        self.thread.start()
+        self.session = self.run(self._open())
+
+    async def _open(self) -> aiohttp.ClientSession:
+        """Creates the session, within the event loop
+
+        :return: aiohttp ClientSession
+        """
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, keepalive_timeout=60)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def run(self, coroutine):
+        """Runs a coroutine on the event loop and waits for the result, can be called from any thread
+
+        :param coroutine: coroutine object
+
+        :return: result of coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def request(self, method: str, url: str, params: dict = None, data: dict = None, headers: dict = None,
+                      as_json: bool = False):
+        """Performs a request, retries failed requests
+
+        :param method: HTTP method, "GET" or "POST"
+        :param url: URL
+        :param params: query string parameters
+        :param data: form data
+        :param headers: request headers
+        :param as_json: decodes the response body as JSON
+
+        :return: response body as bytes, or JSON object if as_json
+        """
+        host = urlsplit(url).hostname
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.host_limits.get(host, self.limit_per_host))
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphores[host]:
+                    async with self.session.request(method, url, params=params, data=data,
+                                                    headers=headers) as response:
+                        response.raise_for_status()
+                        if as_json:
+                            return await response.json(content_type=None)
+                        return await response.read()
+
+            # client errors other than too many requests are not retried
+            except aiohttp.ClientResponseError as caught:
+                if caught.status < 500 and caught.status != 429:
+                    raise
+                error = caught
+            except (aiohttp.ClientError, asyncio.TimeoutError) as caught:
+                error = caught
+
+            # waits before retrying, longer each attempt
+            if attempt < self.retries:
+                logging.info("request to " + url + " failed, retrying: " + type(error).__name__ + " " + str(error))
+                await asyncio.sleep(2 ** attempt)
+        raise error
+
+    async def sparql(self, endpoint_url: str, query: str) -> dict:
+        """Performs a SPARQL query
+
+        :param endpoint_url: SPARQL endpoint
+        :param query: SPARQL query
+
+        :return: SPARQL JSON results
+        """
+        return await self.request("POST", endpoint_url, data={"query": query},
+                                  headers={"Accept": "application/sparql-results+json"}, as_json=True)
+
+    async def _gather(self, coroutines: list) -> list:
+        """Runs the coroutines concurrently
+
+        :param coroutines: list of coroutine objects
+
+        :return: list of results in the order of coroutines
+        """
+        return await asyncio.gather(*coroutines)
+
+    def fetch(self, url: str, **kwargs) -> bytes:
+        """Performs a GET request
+
+        :param url: URL
+        :param kwargs: keyword arguments of request()
+
+        :return: response body
+        """
+        return self.run(self.request("GET", url, **kwargs))
+
+    def fetch_many(self, urls: list, **kwargs) -> list:
+        """Performs GET requests concurrently
+
+        :param urls: list of URLs
+        :param kwargs: keyword arguments of request()
+
+        :return: list of response bodies in the order of urls
+        """
+        return self.run(self._gather([self.request("GET", url, **kwargs) for url in urls]))
+
+    def sparql_query(self, endpoint_url: str, query: str) -> dict:
+        """Performs a SPARQL query
+
+        :param endpoint_url: SPARQL endpoint
+        :param query: SPARQL query
+
+        :return: SPARQL JSON results
+        """
+        return self.run(self.sparql(endpoint_url, query))
+
+    def sparql_many(self, endpoint_url: str, queries: list) -> list:
+        """Performs SPARQL queries concurrently
+
+        :param endpoint_url: SPARQL endpoint
+        :param queries: list of SPARQL queries
+
+        :return: list of SPARQL JSON results in the order of queries
+        """
+        return self.run(self._gather([self.sparql(endpoint_url, query) for query in queries]))
+
+    def close(self):
+        """Closes the connections and stops the event loop, only in the process that created the client
+        """
+        if self.closed or self.pid != os.getpid():
+            return
+        self.closed = True
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def get_http_client() -> HttpClient:
+    """Returns the shared HTTP client, created on first use and closed at exit. A process creates its own client.
+
+    :return: HttpClient
+    """
+    global http_client
+    with http_lock:
+        if http_client is None or http_client.pid != os.getpid():
+            http_client = HttpClient(host_limits=host_limits)
+            atexit.register(http_client.close)
+        return http_client
@@ -1,15 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from bs4 import BeautifulSoup
 from Bio.Restriction import EcoRI, NheI, XbaI, SpeI, PstI, BglII, BamHI, XhoI, AgeI, AarI, RestrictionBatch
 import os
 import logging
 from BB_parser_functions import *
 from Diamondblast_functions import *
 from WDI_writer import *
-from WDI_writer_functions import prepare
+from WDI_writer_functions import prepare, get_label_index, save_label_index
+from Upload_functions import UploadExecutor
+from Cache_functions import SQLiteCache
+from Store_functions import RecordStore, RunManifest
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from collections import deque
+from queue import Queue, Empty, Full
+import threading
+import shutil
 import pickle
+import time
 import sys
 
 __author__ = "Riemer van der Vliet"
@@ -24,23 +34,51 @@ __status__ = "Development"
 """
 The Main script orchestrates the entirety of the uploading. Within the script it has two possible paths
 to run, the "new" pathway and the "old" pathway. main_old(), uses prior created files to upload to the Wikibase
-and the main_new(), deletes old files and creates new files to upload to the Wikibase. To run the script, provide the 
-following system arguments: "old/new username password"
+and the main_new(), deletes old files and creates new files to upload to the Wikibase. main_pipeline() creates the
+new files as main_new() does, but parses, aligns, enriches and uploads the biobricks in concurrent stages. To run the
+script, provide the following system arguments: "old/new/stream username password"
 """
 
-sys.setrecursionlimit(10000)
-
-
 # defines paths to objects and directories
 input_path = '../Parts/xml_parts.txt'
 blasted_file = '../Parts/Db_output.xml'
-fasta_loc = '../Parts/fastafile.fna'
+# DIAMOND output format, 5 (XML) or 6 (tabular, e.g. with blasted_file '../Parts/Db_output.tsv')
+blast_outfmt = 5
+# Number of concurrent DIAMOND processes and total number of threads divided over these
+blast_shards = 4
+blast_threads = os.cpu_count()
 T_directory = "../Parts/Temp_pickle/"
 F_directory = "../Parts/Final_pickle/"
+# Record stores replacing the pickle directories, the directories are only read by "migrate"
+T_store_loc = "../Parts/Temp_parts.sqlite"
+F_store_loc = "../Parts/Final_parts.sqlite"
+# Fingerprints of the statements written to the Wikibase per part
+fingerprint_loc = "../Parts/fingerprints.sqlite"
+# Stage reached by each part per run of main_new
+manifest_loc = "../Parts/manifest.sqlite"
 
 # Path to database .dmnd file
 database = '/nvme1/riemer/uniprot/UniProt_TREMBL_2020-06.dmnd'
 
+# Database version, alignments of previous runs against the same version are reused, set by open_stores()
+BL_version = None
+
+# Alignment cache key per part name, filled by the parser
+BL_keys = {}
+
+# Writer of the sequences to be blasted, opened by main_new
+fasta_writer = None
+
+# Run manifest of main_new, None when not recording stages
+manifest = None
+
+# Number of parts per update of the run manifest by the enrichment and upload stages
+manifest_batch_size = 500
+
+# Uploaded parts not yet recorded in the run manifest
+uploaded_names = []
+uploaded_lock = threading.Lock()
+
 # Wikibase SPARQL endpoint
 endpoint_url = "https://bioparts.wiki.opencura.com/query/sparql?"
 
@@ -53,6 +91,17 @@ mediawiki_api_url = "https://bioparts.wiki.opencura.com/w/api.php"
 # iGEM HTML sequence
 iGEM_sequence_url = "http://parts.iGEM.org/cgi/partsdb/composite_edit/putseq.cgi?part="
 
+# Number of concurrent uploads to the Wikibase
+upload_workers = 8
+
+# Number of processes annotating the sequences and number of parts per batch, 1 process annotates inline
+annotation_workers = os.cpu_count() or 1
+annotation_batch_size = 200
+
+# Maximum number of parts waiting between the stages of the "stream" pipeline and number of parts per UniProt batch
+pipeline_queue_size = 1000
+enrich_batch_size = 250
+
 logging.basicConfig(level=logging.INFO)
 
 # Unwanted keys to be removed
@@ -70,7 +119,7 @@ BL_unwanted = ["Hit_num", "Hit_hsps", "Hsp_num", "Hsp_query-from", "Hsp_query-to
                "Hsp_align-len",
                "Hsp_score", "Hit_len", "Hsp_score"]
 # Restriction site objects from Biopython
-RS = [EcoRI, XbaI, SpeI, PstI, NheI, BglII, BamHI, XhoI, PstI, AarI]
+RS = [EcoRI, XbaI, SpeI, PstI, NheI, BglII, BamHI, XhoI, AarI]
 
 # Items used by WDI writer
 items = ["UniProt", "TrEMBL", "iGEM Parts Registry", "RFC10", "RFC12", "RFC21", "RFC23", "RFC25", "EcoRI", "XbaI",
@@ -81,39 +130,149 @@ items = ["UniProt", "TrEMBL", "iGEM Parts Registry", "RFC10", "RFC12", "RFC21",
          "Protein_Domain", "Other"
          ]
 
-# Opens input path
-input_file = open(input_path, 'r', encoding="utf8", errors="ignore")
+# Record stores, opened by open_stores()
+T_store = None
+F_store = None
+
+
+def open_stores():
+    """Opens the record stores and sets the database version. Not done on import, as the annotation processes import
+    this module as well.
+    """
+    global T_store, F_store, BL_version
+    T_store = RecordStore(T_store_loc)
+    F_store = RecordStore(F_store_loc)
+    BL_version = database_version(database)
+
 
-def BB_parser(input_file, BB_unwanted: list):
+def BB_parser(input_file, BB_unwanted: list, workers: int = None, batch_size: int = None, sink=None):
     """
-    Parses the input file and runs the WDI for each of the different biobricks.
+    Parses the input file and runs the WDI for each of the different biobricks. The file is parsed one "row" at a
+    time, so the full XML tree is never held in memory. The sequences are annotated in batches by a pool of
+    processes while parsing continues, the biobricks are prepared in the order of the file.
 
     :param input_file: initial XML file
     :param BB_unwanted: Unwanted items to be removed
+    :param workers: number of annotation processes, defaults to annotation_workers
+    :param batch_size: number of biobricks per batch, defaults to annotation_batch_size
+    :param sink: function called with each prepared WDI_dict, defaults to storing it in T_store
+    """
+    workers = workers or annotation_workers
+    batch_size = batch_size or annotation_batch_size
+
+    # annotates inline, in batches
+    if workers <= 1:
+        batch = []
+        for children in BB_iterparse(input_file, tag='row'):
+            BB_dict = BB_func_element(children, BB_unwanted)
+            if BB_dict is not None and not BB_resumed(BB_dict):
+                batch.append(BB_dict)
+                if len(batch) >= batch_size:
+                    BB_prepare_batch(batch, sink=sink)
+                    batch = []
+        if batch:
+            BB_prepare_batch(batch, sink=sink)
+        return
+
+    # the processes are started by a forkserver, forking this process is unsafe as other threads (uploads, pipeline
+    # stages, HTTP client) may hold locks
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver")) as pool:
+
+        # placeholder for batch and for the batches being annotated
+        batch = []
+        pending = deque()
+
+        # iterates through the rows of the XML file
+        for children in BB_iterparse(input_file, tag='row'):
+            # creates dictionary using BB_func_element()
+            BB_dict = BB_func_element(children, BB_unwanted)
+
+            # filters out empty dictionary and parts annotated in a previous attempt of the run
+            if BB_dict is None or BB_resumed(BB_dict):
+                continue
+
+            batch.append(BB_dict)
+            if len(batch) >= batch_size:
+                pending.append(BB_annotate_submit(pool, batch))
+                batch = []
+
+                # limits the number of batches being annotated, prepares the oldest
+                while len(pending) > workers * 2:
+                    BB_prepare_batch(*pending.popleft(), sink=sink)
+
+        # submits the last batch and prepares the remaining batches
+        if batch:
+            pending.append(BB_annotate_submit(pool, batch))
+        while pending:
+            BB_prepare_batch(*pending.popleft(), sink=sink)
+
+
+def BB_annotate_submit(pool, batch: list) -> tuple:
+    """Submits the sequences of a batch to the annotation process pool
+
+    :param pool: ProcessPoolExecutor
+    :param batch: list of BB_dict
+
+    :return: tuple of batch and Future of the list of annotations
+    """
+    sequences = [(BB_dict['part_name'], BB_dict.get('sequence')) for BB_dict in batch]
+    Part_stage([BB_name for BB_name, value in sequences], "parsed")
+    return batch, pool.submit(sequence_annotate_batch, sequences, RS)
+
+
+def BB_resumed(BB_dict: dict) -> bool:
+    """Tests if the part was annotated in a previous attempt of the run. If so only its sequence is added to the
+    alignment keys and, if not aligned, to the fasta_writer.
+
+    :param BB_dict: dictionary containing data extracted from XML child.
+
+    :return: boolean
+    """
+    if manifest is None or not manifest.reached(BB_dict['part_name'], "annotated"):
+        return False
+    BB_sequence_add(BB_dict['part_name'], BB_dict.get('sequence'))
+    return True
+
+
+def BB_sequence_add(BB_name: str, value: str):
+    """Adds the alignment key of the sequence and adds the sequence to the shards to be blasted, unless aligned in a
+    previous run
+
+    :param BB_name: biobrick part name
+    :param value: nucleotide sequence
     """
+    if value is None or len(value) <= 1:
+        return
+    BL_keys[BB_name] = alignment_key(value, BL_version)
+    if fasta_writer is not None and get_alignment_cache().get(BL_keys[BB_name]) is SQLiteCache.missing:
+        fasta_writer.write(BB_name, value)
 
-    # creates Bs4 object
-    soup = BeautifulSoup(input_file, "xml")
 
-    # parses Bs4 object
-    BB_unparsed = soup.find_all('row')
+def BB_prepare_batch(batch: list, future=None, sink=None):
+    """Prepares the biobricks of a batch using the annotations of the process pool. Stored biobricks are recorded
+    as annotated in the run manifest at once.
 
-    # iterates through object
-    for children in BB_unparsed:
-        # creates dictionary using BB_func()
-        BB_dict = BB_func(children, BB_unwanted)
+    :param batch: list of BB_dict
+    :param future: Future of the list of annotations in the order of the batch, None annotates inline
+    :param sink: function called with each prepared WDI_dict, defaults to storing it in T_store
+    """
+    annotations = future.result() if future is not None else [None] * len(batch)
+    for BB_dict, annotation in zip(batch, annotations):
+        BB_int_prepare(BB_dict, annotation, sink)
 
-        # filters out empty dictionary
-        if BB_dict is not None:
-            BB_int_prepare(BB_dict)
+    if sink is None:
+        Part_stage([BB_dict['part_name'] for BB_dict in batch], "annotated")
 
 
-def BB_int_prepare(BB_dict: dict):
+def BB_int_prepare(BB_dict: dict, annotation: dict = None, sink=None):
     """
-    Parses the children of the main file into dictionaries and stores these. Also makes a fastafile
-    where it adds the sequences to be blasted.
+    Parses the children of the main file into dictionaries and stores these. Also adds the sequences to be blasted
+    to the fasta_writer.
 
     :param BB_dict: dictionary containing data extracted from XML child.
+    :param annotation: restriction sites and assembly compatibilities created by sequence_annotate(). If None the
+        sequence is annotated inline.
+    :param sink: function called with the WDI_dict, defaults to storing it in T_store
     """
 
     # placeholder for dictionary
@@ -138,14 +297,15 @@ def BB_int_prepare(BB_dict: dict):
                 WDI_dict['RS_Dict'] = None
                 WDI_dict['AS_Dict'] = None
             else:
-                # adds sequence to fasta file
-                create_fastafile(BB_name, value, fasta_loc)
+                # adds sequence to the shards to be blasted, unless aligned in a previous run
+                BB_sequence_add(BB_name, value)
 
-                # adds restriction sites to nested dictionary
-                WDI_dict["RS_dict"] = RS_finder(value, RS)
+                # annotates inline if not annotated by the process pool
+                if annotation is None:
+                    annotation = sequence_annotate_batch([(BB_name, value)], RS)[0]
 
-                # iterates dictionary of assembly standards and adds to dictionary
-                for key2, value2 in AS_finder(value).items():
+                # adds restriction sites to nested dictionary and assembly standards to dictionary
+                for key2, value2 in annotation.items():
                     WDI_dict[key2] = value2
 
         # long_description
@@ -176,28 +336,154 @@ def BB_int_prepare(BB_dict: dict):
         else:
             WDI_dict[key] = value
 
-    # filters empty dictionary, otherwise creates pickle file
+    # filters empty dictionary, otherwise stores record or passes it on
     if len(WDI_dict) <= 1:
         pass
+    elif sink is not None:
+        sink(WDI_dict)
     else:
-        Part_pickle(WDI_dict=WDI_dict, directory=T_directory)
+        Part_store(WDI_dict=WDI_dict, store=T_store)
+
+
+def Part_store(WDI_dict: dict, store: RecordStore):
+    """Stores dictionary in the record store
+
+    :param WDI_dict: dictionary containing information of biobrick
+    :param store: record store where dictionary needs to be stored
+    """
+    store.put(WDI_dict)
+
+
+def Part_stage(names: list, stage: str):
+    """Records the stage reached by the parts in the run manifest, if present
+
+    :param names: list of biobrick part names
+    :param stage: one of RunManifest.stages
+    """
+    if manifest is not None and names:
+        manifest.set_many(names, stage)
+
+
+def Part_uploaded(name: str):
+    """Records the upload of the part and removes its temporary record, in batches of manifest_batch_size. The
+    temporary record is kept until the upload is recorded, so uploads not yet recorded after a crash are performed
+    again, unchanged items are skipped by their fingerprint.
+
+    :param name: biobrick part name
+    """
+    with uploaded_lock:
+        uploaded_names.append(name)
+        if len(uploaded_names) < manifest_batch_size:
+            return
+        names = uploaded_names[:]
+        uploaded_names.clear()
+    Part_uploaded_record(names)
+
+
+def Part_uploaded_flush():
+    """Records the uploads not yet recorded by Part_uploaded()
+    """
+    with uploaded_lock:
+        names = uploaded_names[:]
+        uploaded_names.clear()
+    Part_uploaded_record(names)
 
 
-def Part_pickle(WDI_dict: dict, directory: str):
-    """Makes pickle file for dictionary
+def Part_uploaded_record(names: list):
+    """Records the uploads in the run manifest, then removes the temporary records
+
+    :param names: list of biobrick part names
+    """
+    Part_stage(names, "uploaded")
+    T_store.delete_many(names)
+
+
+def WDI_dict_trim(WDI_dict: dict) -> dict:
+    """Removes the empty values and the values too long for the Wikibase
 
     :param WDI_dict: dictionary containing information of biobrick
-    :param directory: directory location where pickle needs to be stored
+
+    :return: WDI_dict containing information of biobrick
+    """
+
+    # if values are too long, they are popped
+    for key, value in WDI_dict.copy().items():
+        if value is None:
+            WDI_dict.pop(key)
+    for key, value in WDI_dict.copy().items():
+        if len(str(value)) >= 250:
+            WDI_dict.pop(key)
+    return WDI_dict
+
+
+def blast_writer(shard_directory: str) -> FastaWriter or None:
+    """Opens the writer of the sequences to be blasted, unless the shards of an unfinished run are present. These are
+    aligned first, the sequences of this run not in the shards are aligned in a following run. A blast file without
+    shards can not be matched to the sequences it aligned and is removed.
+
+    :param shard_directory: directory of the shards, created by blast_shard_directory()
+
+    :return: FastaWriter or None
+    """
+    if os.path.isfile(blasted_file) and not os.path.isdir(shard_directory):
+        logging.warning("removing blast file of an unfinished run " + blasted_file)
+        os.remove(blasted_file)
+
+    if os.path.isfile(shard_directory + "shards.txt"):
+        logging.warning("aligning the shards of an unfinished run")
+        return None
+    return FastaWriter(shard_directory, blast_shards)
+
+
+def blast_run(shard_directory: str, keys: dict) -> dict:
+    """Runs DIAMOND on the shards written by the fasta_writer, stores the alignments in the alignment cache under the
+    keys of the sequences in the shards and indexes the cached alignments. The blast file and the shards are removed
+    once stored.
+
+    :param shard_directory: directory of the shards, created by blast_shard_directory()
+    :param keys: alignment cache key per biobrick part name of the parts to be indexed
+
+    :return: index of BL_dict per biobrick part name, including the alignments of previous runs
     """
-    with open(directory + WDI_dict['part name'] + ".pickle", 'wb') as handle:
-        pickle.dump(WDI_dict, handle, protocol=pickle.DEFAULT_PROTOCOL)
 
+    # placeholder for the index and the keys of the aligned sequences
+    BL_index = {}
+    aligned_keys = {}
+    aligned = os.path.isfile(shard_directory + "shards.txt")
+
+    if aligned:
+        blast_sharded(database, None, blasted_file, shards=blast_shards, threads=blast_threads,
+                      outfmt=blast_outfmt, columns=BL_columns, keep_shards=True)
+        aligned_keys = {BB_name: alignment_key(value, BL_version)
+                        for BB_name, value in fasta_records(shard_directory)}
+
+        # parses the blastfile once into an index per biobrick
+        if blast_outfmt == 6:
+            BL_index = blast_tabular_parser(blasted_file, BL_columns, BL_unwanted)
+        else:
+            BL_index = blast_parser(blasted_file, BL_unwanted)
+    else:
+        logging.info("all sequences are aligned in previous runs, NOT performing BLAST")
+
+    # stores the new alignments and indexes the alignments of the parts
+    BL_index = blast_cache_merge(BL_index, aligned_keys, keys)
 
-def WDI_dict_blast_add(WDI_dict: dict, BL_unparsed) -> dict:
-    """Adds ID to WDI_dict from unparsed blast file
+    # removes the blast file and shards, the alignments are in the cache
+    if aligned:
+        if os.path.isfile(blasted_file):
+            os.remove(blasted_file)
+        shutil.rmtree(shard_directory)
+
+    return BL_index
+
+
+def WDI_dict_blast_add(WDI_dict: dict, BL_index: dict, UP_index: dict = None) -> dict:
+    """Adds ID to WDI_dict from the indexed blast file
 
     :param WDI_dict: dictionary containing information of biobrick
-    :param BL_unparsed: unparsed Bs4 object from BLAST XML file
+    :param BL_index: index of BL_dict per biobrick part name, created by blast_parser()
+    :param UP_index: UniProt information per accession, created by uniprot_batch_enrich(). Accessions not present
+        are queried separately.
 
     :return: WDI_dict containing information of biobrick
     """
@@ -205,8 +491,8 @@ def WDI_dict_blast_add(WDI_dict: dict, BL_unparsed) -> dict:
     # placeholder for dictionary
     ID = {}
 
-    # iterates through parsed blast file in dictionary format.
-    for key, value in blast_BB_parser(WDI_dict['part name'], unparsed=BL_unparsed, unwanted=BL_unwanted).items():
+    # iterates through the blast hit of the biobrick in dictionary format.
+    for key, value in BL_index.get(WDI_dict['part name'], {}).items():
 
         # currently sets Hit_nmr to one
         ID["Hit_nmr"] = 1
@@ -215,6 +501,12 @@ def WDI_dict_blast_add(WDI_dict: dict, BL_unparsed) -> dict:
         # retrieves additional information
         if key == "Hit_accession":
 
+            # uses the batch retrieved information if present
+            if UP_index is not None and value in UP_index:
+                for key2, value2 in UP_index[value].items():
+                    ID[key2] = value2
+                continue
+
             # location is URL
             loc = Sparql_endpoint + value
             logging.info("retrieving uniprot info on " + loc)
@@ -246,115 +538,405 @@ def WDI_dict_blast_add(WDI_dict: dict, BL_unparsed) -> dict:
 
 
 def main_old():
-    """performs the uploading of pickle items using previous pickle files
+    """performs the uploading of records using the previous final record store
     """
+    open_stores()
 
     # logs in and retrieves items and property IDs
     login_instance = wdi_login.WDLogin(user=username, pwd=password,
                                        mediawiki_api_url=mediawiki_api_url)
     [item_lookup, property_lookup] = prepare(items, endpoint_url)
+    label_lookup = get_label_index(endpoint_url)
+    fingerprints = SQLiteCache(fingerprint_loc, table="fingerprint")
 
-    # iterates the files in the final directory, uploads these using WDI_writer function
-    for filename in os.listdir(F_directory):
-        if filename.endswith(".pickle"):
-            with open(F_directory + filename, "rb") as handle:
-                WDI_dict = pickle.load(handle)
+    # uploads concurrently
+    executor = UploadExecutor(workers=upload_workers)
 
-                WDI_writer(WDI_dict, item_lookup, property_lookup, login_instance, endpoint_url, mediawiki_api_url)
-        else:
-            continue
+    # iterates the records in the final store, uploads these using WDI_writer function
+    for WDI_dict in F_store.scan():
+        executor.submit(WDI_dict['part name'], WDI_writer, WDI_dict, item_lookup, property_lookup,
+                        login_instance, endpoint_url, mediawiki_api_url, label_lookup, fingerprints)
+
+    # waits for the uploads to finish
+    executor.shutdown()
+    logging.info(executor.summary())
 
+    # stores the label index including the created items
+    save_label_index(label_lookup)
 
-def main_new():
-    """Makes new files for Final_pickle, performing the blast, parsing the BB dictionary, querying uniprot etc.
+
+def migrate():
+    """Imports the pickle files of the temporary and final pickle directories into the record stores
     """
-    logging.warning("Deleting old files and making new files")
+    open_stores()
+    for directory, store in [(T_directory, T_store), (F_directory, F_store)]:
+        if os.path.isdir(directory):
+            store.migrate(directory)
 
-    # removes old files.
-    for filename in os.listdir(F_directory):
-        if filename.endswith(".pickle"):
-            os.remove(F_directory + filename)
-        else:
-            pass
+
+def main_new(run_id: str):
+    """Makes new records for the final record store, performing the blast, parsing the BB dictionary, querying
+    uniprot etc. The stage reached by each part is recorded in the run manifest, restarting with the same run ID
+    continues each part from its first unfinished stage.
+
+    :param run_id: ID of the run in the manifest
+    """
+    global manifest
+    open_stores()
+    manifest = RunManifest(manifest_loc, run_id)
+
+    if len(manifest) > 0:
+        logging.warning("resuming run " + run_id + " " + str(manifest.counts()))
+    else:
+        logging.warning("Deleting old records and making new records, run " + run_id)
+
+        # removes old records.
+        F_store.clear()
 
     # logs in and retrieves items and property IDs
     login_instance = wdi_login.WDLogin(user=username, pwd=password,
                                        mediawiki_api_url=mediawiki_api_url)
     [item_lookup, property_lookup] = prepare(items, endpoint_url)
+    label_lookup = get_label_index(endpoint_url)
+    fingerprints = SQLiteCache(fingerprint_loc, table="fingerprint")
 
-    # runs the parser
-    BB_parser(input_file, BB_unwanted)
+    # writes the sequences directly into the shards to be blasted, unless the shards of an unfinished run are present
+    global fasta_writer
+    shard_directory = blast_shard_directory(blasted_file)
+    fasta_writer = blast_writer(shard_directory)
 
-    # checking if blastfile is present, if present does not perform BLAST
-    if os.path.isfile(blasted_file) != True:
-        blast(database, fasta_loc, blasted_file)
-    else:
-        logging.warning("NOT performING BLAST, REMOVE BLAST FILE")
+    # runs the parser, binary mode as the XML is parsed incrementally
+    with open(input_path, 'rb') as input_file:
+        BB_parser(input_file, BB_unwanted)
 
-    # parses the blastfile
-    blasted_file_handle = open(blasted_file, encoding="utf8", errors="ignore")
-    BL_unparsed = blast_parser(blasted_file_handle)
+    if fasta_writer is not None:
+        fasta_writer.close()
+        fasta_writer = None
 
-    # iterates through the temporary pickle files. Makes final pickle files and writes updates or creates new files
-    for filename in os.listdir(T_directory):
-        if filename.endswith(".pickle"):
-            with open(T_directory + filename, "rb") as handle:
+    # runs the blast and indexes the alignments
+    BL_index = blast_run(shard_directory, BL_keys)
 
-                WDI_dict_V1 = pickle.load(handle)
+    # retrieves the UniProt information of the hits of the parts not enriched in a previous attempt, in batches
+    UP_index = uniprot_batch_enrich([BL_dict["Hit_accession"] for BB_name, BL_dict in BL_index.items()
+                                     if "Hit_accession" in BL_dict and not manifest.reached(BB_name, "enriched")],
+                                    Sparql_endpoint)
 
-                # if values are too long, they are popped
-                for key, value in WDI_dict_V1.copy().items():
-                    if value is None:
-                        WDI_dict_V1.pop(key)
-                for key, value in WDI_dict_V1.copy().items():
-                    if len(str(value)) >= 250:
-                        WDI_dict_V1.pop(key)
+    # uploads concurrently
+    executor = UploadExecutor(workers=upload_workers)
 
-                # adds information retrieved from BLAST
-                WDI_dict_V2 = WDI_dict_blast_add(WDI_dict=WDI_dict_V1, BL_unparsed=BL_unparsed)
+    # placeholder for the enriched parts not yet recorded in the manifest
+    enriched = []
 
-                # pickles file as final pickle
-                Part_pickle(WDI_dict=WDI_dict_V2, directory=F_directory)
+    # iterates through the temporary records. Makes final records and writes updates or creates new files
+    for WDI_dict_V1 in T_store.scan():
+        BB_name = WDI_dict_V1['part name']
 
-                # uploads final pickle files
-                WDI_writer(WDI_dict_V2, item_lookup, property_lookup, login_instance, endpoint_url, mediawiki_api_url)
+        # removes parts uploaded in a previous attempt
+        if manifest.reached(BB_name, "uploaded"):
+            T_store.delete(BB_name)
+            continue
 
-                # closes file
-                handle.close()
+        # uses the final record of a previous attempt
+        WDI_dict_V2 = F_store.get(BB_name) if manifest.reached(BB_name, "enriched") else None
 
-                # removes temporary pickle file
-                os.remove(T_directory + filename)
-        else:
+        if WDI_dict_V2 is None:
+            # if values are too long, they are popped
+            WDI_dict_trim(WDI_dict_V1)
+
+            # adds information retrieved from BLAST
+            WDI_dict_V2 = WDI_dict_blast_add(WDI_dict=WDI_dict_V1, BL_index=BL_index, UP_index=UP_index)
+
+            # stores final record, records the enriched parts in batches
+            Part_store(WDI_dict=WDI_dict_V2, store=F_store)
+            enriched.append(BB_name)
+            if len(enriched) >= manifest_batch_size:
+                Part_stage(enriched, "enriched")
+                enriched = []
+
+        # uploads final records, removes temporary record after the upload succeeded
+        executor.submit(BB_name, WDI_writer, WDI_dict_V2, item_lookup, property_lookup,
+                        login_instance, endpoint_url, mediawiki_api_url, label_lookup, fingerprints,
+                        callback=partial(Part_uploaded, BB_name))
+    Part_stage(enriched, "enriched")
+
+    # waits for the uploads to finish
+    executor.shutdown()
+    Part_uploaded_flush()
+    logging.info(executor.summary())
+
+    # stores the label index including the created items
+    save_label_index(label_lookup)
+
+    logging.info("UniProt cache " + str(get_uniprot_cache().stats()))
+    logging.info("run " + run_id + " " + str(manifest.counts()))
+
+
+
+def pipeline_put(queue: Queue, item, abort: threading.Event):
+    """Puts the item in the bounded queue, blocks while the queue is full
+
+    :param queue: queue between two stages
+    :param item: item passed to the next stage, None ends the stage
+    :param abort: set when a stage failed
+    """
+    while True:
+        if abort.is_set():
+            raise RuntimeError("pipeline aborted")
+        try:
+            queue.put(item, timeout=1)
+            return
+        except Full:
+            continue
+
+
+def pipeline_get(queue: Queue, abort: threading.Event):
+    """Gets an item from the queue, blocks while the queue is empty
+
+    :param queue: queue between two stages
+    :param abort: set when a stage failed
+
+    :return: item of the previous stage, None when the previous stage ended
+    """
+    while True:
+        if abort.is_set():
+            raise RuntimeError("pipeline aborted")
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            continue
+
+
+def pipeline_stage(function, abort: threading.Event, errors: list, *args) -> threading.Thread:
+    """Starts a stage in a thread. A failing stage stores its exception and aborts the other stages.
+
+    :param function: function of the stage
+    :param abort: set when a stage failed
+    :param errors: list the exception is added to
+    :param args: arguments of function
+
+    :return: started thread
+    """
+    def run():
+        try:
+            function(*args, abort)
+        except Exception as error:
+            if not abort.is_set():
+                logging.warning("pipeline stage " + function.__name__ + " failed: " + repr(error))
+                errors.append(error)
+                abort.set()
+
+    thread = threading.Thread(target=run, name=function.__name__, daemon=True)
+    thread.start()
+    return thread
+
+
+def stream_parse(input_file, parsed: Queue, abort: threading.Event):
+    """Parsing and annotation stage, passes the prepared WDI_dict to the next stage
+
+    :param input_file: initial XML file, opened in binary mode
+    :param parsed: queue of WDI_dict
+    :param abort: set when a stage failed
+    """
+    global fasta_writer
+    BB_parser(input_file, BB_unwanted, sink=lambda WDI_dict: pipeline_put(parsed, WDI_dict, abort))
+
+    # sequences not aligned in previous runs are complete
+    if fasta_writer is not None:
+        fasta_writer.close()
+        fasta_writer = None
+    pipeline_put(parsed, None, abort)
+
+
+def stream_join(shard_directory: str, parsed: Queue, joined: Queue, abort: threading.Event):
+    """Alignment join stage, adds the alignment of each part. Parts aligned in a previous run or without a sequence are
+    passed on directly, the other parts wait in T_store until the blast of the new sequences finished.
+
+    :param shard_directory: directory of the shards, created by blast_shard_directory()
+    :param parsed: queue of WDI_dict
+    :param joined: queue of tuples of WDI_dict and BL_dict or None
+    :param abort: set when a stage failed
+    """
+    cache = get_alignment_cache()
+
+    while True:
+        WDI_dict = pipeline_get(parsed, abort)
+        if WDI_dict is None:
+            break
+        WDI_dict_trim(WDI_dict)
+
+        # parts without a sequence
+        key = BL_keys.get(WDI_dict['part name'])
+        if key is None:
+            pipeline_put(joined, (WDI_dict, None), abort)
             continue
 
+        # parts aligned in a previous run, otherwise waits for the blast
+        BL_dict = cache.get(key)
+        if BL_dict is SQLiteCache.missing:
+            Part_store(WDI_dict=WDI_dict, store=T_store)
+        else:
+            pipeline_put(joined, (WDI_dict, BL_dict), abort)
+
+    # aligns the waiting parts
+    names = T_store.names()
+    logging.info(str(len(names)) + " parts waiting for the blast")
+    BL_index = blast_run(shard_directory, {name: BL_keys[name] for name in names if name in BL_keys})
+
+    for WDI_dict in T_store.scan():
+        pipeline_put(joined, (WDI_dict, BL_index.get(WDI_dict['part name'])), abort)
+    pipeline_put(joined, None, abort)
+
+
+def stream_enrich(joined: Queue, upload, abort: threading.Event):
+    """UniProt enrichment stage, retrieves the UniProt information of the hits in batches, stores the final records
+    and submits these for uploading. Incomplete batches are enriched when no parts are waiting.
+
+    :param joined: queue of tuples of WDI_dict and BL_dict or None
+    :param upload: function submitting the upload of a WDI_dict
+    :param abort: set when a stage failed
+    """
+
+    # placeholder for batch
+    batch = []
+
+    while True:
+        try:
+            item = joined.get(timeout=1)
+        except Empty:
+            if abort.is_set():
+                raise RuntimeError("pipeline aborted")
+            item = False
+
+        if item:
+            batch.append(item)
+            if len(batch) < enrich_batch_size:
+                continue
+
+        if batch:
+            # retrieves the UniProt information of the hits of the batch
+            UP_index = uniprot_batch_enrich([BL_dict["Hit_accession"] for WDI_dict, BL_dict in batch
+                                             if BL_dict is not None and "Hit_accession" in BL_dict], Sparql_endpoint)
+
+            for WDI_dict, BL_dict in batch:
+                BL_index = {} if BL_dict is None else {WDI_dict['part name']: BL_dict}
+                WDI_dict = WDI_dict_blast_add(WDI_dict=WDI_dict, BL_index=BL_index, UP_index=UP_index)
+
+                # stores final record and uploads it
+                Part_store(WDI_dict=WDI_dict, store=F_store)
+                upload(WDI_dict)
+            batch = []
+
+        if item is None:
+            return
+
+
+def main_pipeline():
+    """Makes new records for the final record store as main_new() does, with the parsing and annotation, the
+    alignment join, the UniProt enrichment and the uploading running as concurrent stages. The stages are linked by
+    bounded queues, so a slow stage holds back the previous stages. Only the parts waiting for the blast are stored
+    in T_store.
+    """
+    logging.warning("Deleting old records and making new records")
+
+    # removes old records.
+    open_stores()
+    F_store.clear()
+    T_store.clear()
+
+    # logs in and retrieves items and property IDs
+    login_instance = wdi_login.WDLogin(user=username, pwd=password,
+                                       mediawiki_api_url=mediawiki_api_url)
+    [item_lookup, property_lookup] = prepare(items, endpoint_url)
+    label_lookup = get_label_index(endpoint_url)
+    fingerprints = SQLiteCache(fingerprint_loc, table="fingerprint")
+
+    # writes the sequences directly into the shards to be blasted, unless the shards of an unfinished run are present
+    global fasta_writer
+    shard_directory = blast_shard_directory(blasted_file)
+    fasta_writer = blast_writer(shard_directory)
+
+    # uploads concurrently, submitting blocks while the maximum of pending uploads is reached
+    executor = UploadExecutor(workers=upload_workers)
+
+    def upload(WDI_dict):
+        executor.submit(WDI_dict['part name'], WDI_writer, WDI_dict, item_lookup, property_lookup,
+                        login_instance, endpoint_url, mediawiki_api_url, label_lookup, fingerprints,
+                        callback=partial(T_store.delete, WDI_dict['part name']))
+
+    # bounded queues between the stages
+    parsed = Queue(maxsize=pipeline_queue_size)
+    joined = Queue(maxsize=pipeline_queue_size)
+    abort = threading.Event()
+    errors = []
+
+    # binary mode as the XML is parsed incrementally
+    with open(input_path, 'rb') as input_file:
+        threads = [pipeline_stage(stream_parse, abort, errors, input_file, parsed),
+                   pipeline_stage(stream_join, abort, errors, shard_directory, parsed, joined),
+                   pipeline_stage(stream_enrich, abort, errors, joined, upload)]
+        for thread in threads:
+            thread.join()
+
+    # waits for the uploads to finish
+    executor.shutdown()
+    logging.info(executor.summary())
+
+    # stores the label index including the created items
+    save_label_index(label_lookup)
+
+    logging.info("UniProt cache " + str(get_uniprot_cache().stats()))
+
+    if errors:
+        raise errors[0]
+
 
 if __name__ == '__main__':
     """Contains two functions and ask which one to use via sys.argv. 
     """
 
+    usage = """
+            wrong arguments provided, please inform if running "new" files are to be used or "old" files.
+            [new/stream/old/migrate] [username] [password] [run_id]
+            """
+
+    if len(sys.argv) < 2:
+        print(usage)
+        quit()
+
     method      = sys.argv[1]
+
+    # imports the pickle directories of previous versions, no log in needed
+    if method == "migrate":
+        logging.info("migrating pickle directories to record stores")
+        migrate()
+        quit()
+
+    if len(sys.argv) < 4:
+        print(usage)
+        quit()
+
     username    = sys.argv[2]
     password    = sys.argv[3]
 
-    if len(sys.argv) < 3:
-        print("""
-            wrong arguments provided, please inform if running "new" files are to be used or "old" files.
-            [username] [password]
-            """)
-        quit()
+    # run ID of the manifest, a new run unless the ID of an unfinished run is provided
+    run_id      = sys.argv[4] if len(sys.argv) > 4 else time.strftime("%Y%m%d-%H%M%S")
 
     # checks if the pipeline is supposed to create new files or use the old ones
     if method == "old":
         logging.info("running the pipeline using old files")
         main_old()
 
-    if method == "new":
-        logging.info("running the pipeline creating new files")
-        main_new()
+    elif method == "new":
+        logging.info("running the pipeline creating new files, resume with: python3 MAIN.py new [username] "
+                     "[password] " + run_id)
+        main_new(run_id)
 
-    # if method is not "old" or "new".
+    elif method == "stream":
+        logging.info("running the pipeline creating new files in concurrent stages")
+        main_pipeline()
+
+    # if method is not "old", "new" or "stream".
     else:
-        logging.info("""
-        no correct system argument provided, inform if running the script using "new" or "old" files, not""", method)
+        logging.info("no correct system argument provided, inform if running the script using \"new\", \"stream\" "
+                     "or \"old\" files, not " + method)
         quit()
-
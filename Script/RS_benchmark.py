@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from Bio.Restriction import EcoRI, NheI, XbaI, SpeI, PstI, BglII, BamHI, XhoI, AgeI, AarI
+from BB_parser_functions import *
+import random
+import time
+import sys
+
+__author__ = "Riemer van der Vliet"
+__copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
+__credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Riemer van der Vliet"
+__email__ = "riemer.vandervliet@wur.nl"
+__status__ = "Development"
+
+"""
+Benchmarks the single pass restriction site scanner (RS_finder, AS_finder) against the Biopython search of each
+enzyme (RS_finder_Bio, AS_finder_Bio) and checks that both give the same output. Uses the sequences of the XML file
+when provided: "python3 RS_benchmark.py [path to XML file]", otherwise random sequences.
+"""
+
+# Restriction site objects from Biopython, as in MAIN.py
+RS = [EcoRI, XbaI, SpeI, PstI, NheI, BglII, BamHI, XhoI, AarI]
+
+
+def random_sequences(number: int, length: int) -> list:
+    """Creates random nucleotide sequences, with restriction sites inserted to have hits.
+
+    :param number: number of sequences
+    :param length: length of each sequence
+
+    :return: list of nucleotide sequences
+    """
+    random.seed(1)
+    sites = [str(enzyme.site) for enzyme in RS + [AgeI]] + ["GCAGGTG"]
+    sequences = []
+    for i in range(number):
+        seq = "".join(random.choice("acgt") for j in range(length))
+        for site in random.sample(sites, 3):
+            position = random.randrange(length)
+            seq = seq[:position] + site.lower() + seq[position:]
+        sequences.append(seq)
+    return sequences
+
+
+def xml_sequences(input_path: str) -> list:
+    """Retrieves the nucleotide sequences of the XML file
+
+    :param input_path: path to XML file
+
+    :return: list of nucleotide sequences
+    """
+    sequences = []
+    with open(input_path, 'rb') as input_file:
+        for children in BB_iterparse(input_file, tag='row'):
+            for field in children.findall("field"):
+                if field.get("name") == "sequence" and field.text is not None and len(field.text) > 1:
+                    sequences.append(field.text)
+    return sequences
+
+
+def benchmark(sequences: list):
+    """Runs both implementations, compares the output and logs the time
+
+    :param sequences: list of nucleotide sequences
+    """
+
+    # Biopython search of each enzyme
+    start = time.time()
+    expected = [(RS_finder_Bio(seq, RS), AS_finder_Bio(seq)) for seq in sequences]
+    time_Bio = time.time() - start
+
+    # single pass scanner
+    start = time.time()
+    found = [(RS_finder(seq, RS), AS_finder(seq)) for seq in sequences]
+    time_scan = time.time() - start
+
+    # compares output
+    mismatches = [seq for seq, x, y in zip(sequences, expected, found) if x != y]
+    for seq in mismatches[:10]:
+        logging.warning("output differs for " + seq)
+
+    logging.info(str(len(sequences)) + " sequences, " + str(len(mismatches)) + " differ")
+    logging.info("Biopython %.2f s, single pass %.2f s, speedup %.1f" % (time_Bio, time_scan, time_Bio / time_scan))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        benchmark(xml_sequences(sys.argv[1]))
+    else:
+        benchmark(random_sequences(2000, 2000))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import pickle
+import threading
+import logging
+
+__author__ = "Riemer van der Vliet"
+__copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
+__credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Riemer van der Vliet"
+__email__ = "riemer.vandervliet@wur.nl"
+__status__ = "Development"
+
+"""
+Record store used by the MAIN and Add_assembly scripts. Stores the pickled dictionaries of the biobricks in a single
+SQLite file, replacing the directories with a pickle file per biobrick. Also contains the run manifest, recording the
+stage each biobrick reached in a run.
+"""
+
+logging.basicConfig(level=logging.INFO)
+
+
+class RecordStore:
+    """Single file store of WDI_dict dictionaries keyed by part name. Supports sequential scans in insertion order and
+    random access by part name.
+    """
+
+    def __init__(self, location: str, page_size: int = 500):
+        """
+        :param location: location of the SQLite file
+        :param page_size: number of records read per query during a scan
+        """
+        self.location = location
+        self.page_size = page_size
+
+        # connection is shared between threads, access is guarded by the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(location, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS records (name TEXT PRIMARY KEY, data BLOB)")
+        self.connection.commit()
+
+    def put(self, WDI_dict: dict):
+        """Stores the dictionary under its part name, replaces a present record.
+
+        :param WDI_dict: dictionary containing information of biobrick
+        """
+        self.put_many([WDI_dict])
+
+    def put_many(self, WDI_dicts: list):
+        """Stores the dictionaries under their part names in a single transaction.
+
+        :param WDI_dicts: list of dictionaries containing information of biobricks
+        """
+        rows = [(WDI_dict['part name'], pickle.dumps(WDI_dict, protocol=pickle.DEFAULT_PROTOCOL))
+                for WDI_dict in WDI_dicts]
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO records (name, data) VALUES (?, ?)", rows)
+            self.connection.commit()
+
+    def get(self, name: str) -> dict or None:
+        """Returns the dictionary of the part name
+
+        :param name: biobrick part name
+
+        :return: WDI_dict or None
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM records WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0])
+
+    def delete(self, name: str):
+        """Removes the record of the part name
+
+        :param name: biobrick part name
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM records WHERE name = ?", (name,))
+            self.connection.commit()
+
+    def delete_many(self, names: list):
+        """Removes the records of the part names in a single transaction.
+
+        :param names: list of biobrick part names
+        """
+        with self.lock:
+            self.connection.executemany("DELETE FROM records WHERE name = ?", [(name,) for name in names])
+            self.connection.commit()
+
+    def clear(self):
+        """Removes all records
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM records")
+            self.connection.commit()
+
+    def names(self) -> list:
+        """Returns the part names of all records
+
+        :return: list of part names
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT name FROM records ORDER BY rowid")]
+
+    def scan(self):
+        """Yields all records in insertion order. Records are read in pages, so records may be stored or removed
+        during the scan.
+
+        :return: generator of WDI_dict
+        """
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute("SELECT rowid, data FROM records WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                               (last, self.page_size)).fetchall()
+            if not rows:
+                return
+            for rowid, data in rows:
+                yield pickle.loads(data)
+            last = rows[-1][0]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def __contains__(self, name: str) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM records WHERE name = ?", (name,)).fetchone() is not None
+
+    def migrate(self, directory: str, batch_size: int = 1000) -> int:
+        """Imports the pickle files of a pickle directory into the store. The pickle files are kept.
+
+        :param directory: directory containing a pickle file per biobrick
+        :param batch_size: number of records stored per transaction
+
+        :return: number of imported records
+        """
+        batch = []
+        count = 0
+
+        # iterates the pickle files in the directory
+        for filename in os.listdir(directory):
+            if filename.endswith(".pickle"):
+                with open(directory + filename, "rb") as handle:
+                    batch.append(pickle.load(handle))
+                if len(batch) >= batch_size:
+                    self.put_many(batch)
+                    count += len(batch)
+                    batch = []
+
+        self.put_many(batch)
+        count += len(batch)
+        logging.info("migrated " + str(count) + " records from " + directory + " to " + self.location)
+        return count
+
+    def close(self):
+        """Closes the SQLite connection
+        """
+        with self.lock:
+            self.connection.close()
+
+
+class RunManifest:
+    """Stage reached by each part name in a run, stored in a SQLite file. Every update is a single transaction and a
+    stage never moves back, so after a crash the manifest holds the last completed stage of each part.
+    """
+
+    # stages in order of the pipeline
+    stages = ("parsed", "annotated", "enriched", "uploaded")
+
+    def __init__(self, location: str, run: str):
+        """
+        :param location: location of the SQLite file
+        :param run: run ID, several runs can share a file
+        """
+        self.location = location
+        self.run = run
+
+        # connection is shared between threads, access is guarded by the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(location, check_same_thread=False, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS manifest (run TEXT, name TEXT, stage INTEGER, "
+                                "PRIMARY KEY (run, name))")
+        self.connection.commit()
+
+    def stage(self, name: str) -> str or None:
+        """Returns the stage the part reached in the run
+
+        :param name: biobrick part name
+
+        :return: stage or None if the part did not reach any stage
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT stage FROM manifest WHERE run = ? AND name = ?",
+                                          (self.run, name)).fetchone()
+        if row is None:
+            return None
+        return self.stages[row[0]]
+
+    def reached(self, name: str, stage: str) -> bool:
+        """Tests if the part reached the stage, or a later stage, in the run
+
+        :param name: biobrick part name
+        :param stage: one of stages
+
+        :return: boolean
+        """
+        reached = self.stage(name)
+        return reached is not None and self.stages.index(reached) >= self.stages.index(stage)
+
+    def set(self, name: str, stage: str):
+        """Records that the part reached the stage
+
+        :param name: biobrick part name
+        :param stage: one of stages
+        """
+        self.set_many([name], stage)
+
+    def set_many(self, names: list, stage: str):
+        """Records that the parts reached the stage in a single transaction. Parts that reached a later stage keep it.
+
+        :param names: list of biobrick part names
+        :param stage: one of stages
+        """
+        index = self.stages.index(stage)
+        with self.lock:
+            self.connection.executemany("INSERT INTO manifest (run, name, stage) VALUES (?, ?, ?) "
+                                        "ON CONFLICT (run, name) DO UPDATE SET stage = MAX(stage, excluded.stage)",
+                                        [(self.run, name, index) for name in names])
+            self.connection.commit()
+
+    def counts(self) -> dict:
+        """Returns the number of parts per stage reached in the run
+
+        :return: dictionary with stage and number of parts
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT stage, COUNT(*) FROM manifest WHERE run = ? GROUP BY stage",
+                                           (self.run,)).fetchall()
+        counts = {stage: 0 for stage in self.stages}
+        for index, count in rows:
+            counts[self.stages[index]] = count
+        return counts
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM manifest WHERE run = ?", (self.run,)).fetchone()[0]
+
+    def close(self):
+        """Closes the SQLite connection
+        """
+        with self.lock:
+            self.connection.close()
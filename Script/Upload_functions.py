@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import zlib
+
+__author__ = "Riemer van der Vliet"
+__copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
+__credits__ = ["Riemer van der Vliet", "Jasper Koehorst"]
+__license__ = "GPL"
+__version__ = "2.0.0"
+__maintainer__ = "Riemer van der Vliet"
+__email__ = "riemer.vandervliet@wur.nl"
+__status__ = "Development"
+
+"""
+functions called by MAIN.py script. performs the uploading of items to the Wikibase concurrently.
+"""
+
+logging.basicConfig(level=logging.INFO)
+
+
+class UploadExecutor:
+    """Runs uploads on a bounded pool of worker threads. Uploads with the same key (part name) always run on the same
+    worker, in the order they were submitted, so an item is never written by two workers at once. The success or
+    failure of the last upload of each key is collected.
+    """
+
+    def __init__(self, workers: int = 8, max_pending: int = None):
+        """
+        :param workers: number of worker threads
+        :param max_pending: maximum number of submitted uploads not yet finished, submit() blocks when reached.
+            Defaults to four times the number of workers
+        """
+        self.workers = workers
+        self.executors = [ThreadPoolExecutor(max_workers=1) for _ in range(workers)]
+        self.pending = threading.BoundedSemaphore(max_pending or workers * 4)
+        self.lock = threading.Lock()
+
+        # placeholder for results, key and None on success or the exception on failure
+        self.results = {}
+
+        # placeholder for exceptions of the callbacks of successful uploads, per key
+        self.callback_errors = {}
+
+    def submit(self, key: str, function, *args, callback=None, **kwargs):
+        """Submits an upload, blocks while the maximum of pending uploads is reached.
+
+        :param key: key of the item written, usually the part name
+        :param function: function performing the upload, e.g. WDI_writer
+        :param args: arguments of function
+        :param callback: function without arguments called after a successful upload. A failing callback does not
+            fail the upload, its exception is collected separately
+        :param kwargs: keyword arguments of function
+
+        :return: Future of the upload
+        """
+        self.pending.acquire()
+
+        # the same key is always assigned to the same worker
+        executor = self.executors[zlib.crc32(key.encode("utf8")) % self.workers]
+        return executor.submit(self._run, key, function, args, kwargs, callback)
+
+    def _run(self, key: str, function, args: tuple, kwargs: dict, callback):
+        """Performs the upload and stores the result
+
+        :return: return value of function or None on failure
+        """
+        try:
+            try:
+                value = function(*args, **kwargs)
+            except Exception as error:
+                logging.warning("upload of " + key + " failed: " + repr(error))
+                with self.lock:
+                    self.results[key] = error
+                return None
+
+            with self.lock:
+                self.results[key] = None
+                self.callback_errors.pop(key, None)
+
+            # the item is written, a failure of the bookkeeping is recorded apart from the upload
+            if callback is not None:
+                try:
+                    callback()
+                except Exception as error:
+                    logging.warning("bookkeeping after upload of " + key + " failed: " + repr(error))
+                    with self.lock:
+                        self.callback_errors[key] = error
+            return value
+        finally:
+            self.pending.release()
+
+    def shutdown(self) -> dict:
+        """Waits for all uploads to finish and stops the workers.
+
+        :return: dictionary with key and None on success or the exception on failure
+        """
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+        return self.results
+
+    def failed(self) -> dict:
+        """Returns the failed uploads
+
+        :return: dictionary with key and exception
+        """
+        with self.lock:
+            return {key: error for key, error in self.results.items() if error is not None}
+
+    def summary(self) -> str:
+        """Returns a summary of the results
+
+        :return: string with number of successful and failed uploads and of failed callbacks
+        """
+        failed = self.failed()
+        with self.lock:
+            callback_failed = len(self.callback_errors)
+        return (str(len(self.results) - len(failed)) + " uploads succeeded, " + str(len(failed)) + " failed, " +
+                str(callback_failed) + " bookkeeping callbacks failed")
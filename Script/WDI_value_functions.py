@@ -127,3 +127,160 @@ def create_datetime_qualifier(property_lookup: dict):
         is_qualifier=True)
 
     return qual_retrieved
+
+
+# calendar model of time values, as used by WikidataIntegrator
+calendar_model = "http://www.wikidata.org/entity/Q1985727"
+
+
+def snak_datavalue(value: str, datatype: str) -> dict:
+    """Creates the datavalue of a snak in the Wikibase JSON format
+
+    :param value: value string, item ID for "wikibase-item" and time string for "time"
+    :param datatype: Wikibase datatype, "wikibase-item", "string", "external-id", "url" or "time"
+
+    :return: datavalue dictionary
+    """
+    if datatype == "wikibase-item":
+        return {"value": {"entity-type": "item", "numeric-id": int(value[1:]), "id": value},
+                "type": "wikibase-entityid"}
+    if datatype == "time":
+        return {"value": {"time": value, "timezone": 0, "before": 0, "after": 0, "precision": 11,
+                          "calendarmodel": calendar_model},
+                "type": "time"}
+    return {"value": value, "type": "string"}
+
+
+class Snak:
+    """Property and value used as main value, qualifier or reference of a statement. The JSON representation is
+    created once, a snak is not changed after creation and can be shared by statements.
+    """
+    __slots__ = ("prop_nr", "value", "datatype", "json")
+
+    def __init__(self, prop_nr: str, value: str, datatype: str = "string"):
+        """
+        :param prop_nr: Wikibase property ID
+        :param value: value string, item ID for "wikibase-item" and time string for "time"
+        :param datatype: Wikibase datatype, "wikibase-item", "string", "external-id", "url" or "time"
+        """
+        self.prop_nr = prop_nr
+        self.value = value
+        self.datatype = datatype
+        self.json = {"snaktype": "value", "property": prop_nr, "datavalue": snak_datavalue(value, datatype),
+                     "datatype": datatype}
+
+
+class Reference:
+    """Reference of a statement consisting of one or more snaks. Not changed after creation and can be shared by
+    statements.
+    """
+    __slots__ = ("snaks", "json")
+
+    def __init__(self, snaks: list):
+        """
+        :param snaks: list of Snak objects
+        """
+        self.snaks = tuple(snaks)
+        self.json = {"snaks": snak_group(self.snaks), "snaks-order": list(dict.fromkeys(s.prop_nr for s in snaks))}
+
+
+class Statement:
+    """Statement of an item page with references and qualifiers, serializes to the Wikibase JSON format of
+    wbeditentity.
+    """
+    __slots__ = ("mainsnak", "references", "qualifiers")
+
+    def __init__(self, prop_nr: str, value: str, datatype: str = "string", references: list = (),
+                 qualifiers: list = ()):
+        """
+        :param prop_nr: Wikibase property ID
+        :param value: value string, item ID for "wikibase-item" and time string for "time"
+        :param datatype: Wikibase datatype, "wikibase-item", "string", "external-id", "url" or "time"
+        :param references: list of Reference objects
+        :param qualifiers: list of Snak objects
+        """
+        self.mainsnak = Snak(prop_nr, value, datatype)
+        self.references = tuple(references)
+        self.qualifiers = tuple(qualifiers)
+
+    @property
+    def prop_nr(self) -> str:
+        return self.mainsnak.prop_nr
+
+    def get_json_representation(self) -> dict:
+        """Creates the JSON representation of the statement
+
+        :return: statement dictionary
+        """
+        statement_json = {"mainsnak": self.mainsnak.json, "type": "statement", "rank": "normal"}
+        if self.qualifiers:
+            statement_json["qualifiers"] = snak_group(self.qualifiers)
+            statement_json["qualifiers-order"] = list(dict.fromkeys(s.prop_nr for s in self.qualifiers))
+        if self.references:
+            statement_json["references"] = [reference.json for reference in self.references]
+        return statement_json
+
+
+def snak_group(snaks: tuple) -> dict:
+    """Groups the JSON representation of snaks by property
+
+    :param snaks: Snak objects
+
+    :return: dictionary with key property ID and value list of snak dictionaries
+    """
+    group = {}
+    for snak in snaks:
+        group.setdefault(snak.prop_nr, []).append(snak.json)
+    return group
+
+
+def create_shared_values(item_lookup: dict, property_lookup: dict) -> dict:
+    """Creates the references and the qualifier that are equal for all parts. These are created once per run and
+    shared by the statements of all parts.
+
+    :param item_lookup: Wikibase item IDs.
+    :param property_lookup: Wikibase property IDs.
+
+    :return: dictionary with the iGEM registry snak, BLAST and Biopython references and date time qualifier
+    """
+    return {
+        # iGEM registry, part of the iGEM references
+        "iGEM_stated_in": Snak(property_lookup['stated in'], item_lookup['iGEM Parts Registry'], "wikibase-item"),
+
+        # TrEMBL and DIAMOND reference
+        "Blast_ref": Reference([
+            Snak(property_lookup['stated in'], item_lookup['TrEMBL'], "wikibase-item"),
+            Snak(property_lookup['computational inference'], item_lookup['The DIAMOND protein aligner'],
+                 "wikibase-item")]),
+
+        # Biopython reference
+        "Biopython_ref": Reference([
+            Snak(property_lookup['computational inference'], item_lookup['Biopython'], "wikibase-item")]),
+
+        # date time qualifier
+        "datetime_qual": Snak(property_lookup['retrieved'],
+                              datetime.datetime.now().strftime("+%Y-%m-%dT00:00:00Z"), "time")}
+
+
+def iGEM_reference(value: str, shared: dict, property_lookup: dict) -> Reference:
+    """Creates the iGEM reference to the part page of the iGEM Registry of Standard Biological parts.
+
+    :param value: Biobrick label
+    :param shared: references and qualifier created by create_shared_values()
+    :param property_lookup: Wikibase property IDs.
+
+    :return: Reference
+    """
+    return Reference([shared["iGEM_stated_in"],
+                      Snak(property_lookup['reference URL'], "http://parts.iGEM.org/Part:" + value, "url")])
+
+
+def RS_qualifiers(value2: list, property_lookup: dict) -> list:
+    """Creates the qualifiers to annotate where the restriction sites has been located.
+
+    :param value2: list of restriction sites strings
+    :param property_lookup: dictionary containing wikibase property IDs.
+
+    :return: list of Snak
+    """
+    return [Snak(property_lookup['at site'], str(RS_hit)) for RS_hit in value2]
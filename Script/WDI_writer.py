@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import copy
 from wikidataintegrator import wdi_core, wdi_login
 from WDI_value_functions import *
-from WDI_writer_functions import get_item_by_name
+from WDI_writer_functions import get_item_by_name, statement_fingerprint, write_entity
+import threading
 import logging
 
 __author__ = "Riemer van der Vliet"
@@ -22,42 +22,56 @@ functions called by MAIN.py script. performs uploading of dictionary items to wi
 
 logging.basicConfig(level=logging.INFO)
 
+# References and qualifier shared by all parts of a run, created by create_shared_values() on first use
+shared_values = {}
+shared_lock = threading.Lock()
 
-def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
-               login_instance, endpoint_url: str, mediawiki_api_url: str
-               ):
-    """Creates statements for the iterated dictionary and creates an item page is this is not already present.
-    Otherwise updates the item page.
 
-    :param WDI_dict: Containing data to be iterated and uploaded,
+def get_shared_values(item_lookup: dict, property_lookup: dict) -> dict:
+    """Returns the references and the qualifier shared by all parts, created once per run
+
     :param item_lookup: Wikibase item IDs.
     :param property_lookup: Wikibase property IDs.
-    :param login_instance: login instance of the Wikibase bot.
-    :param endpoint_url: SPARQL endpoint of Wikibase.
-    :param mediawiki_api_url: API of Wikibase.
+
+    :return: dictionary created by create_shared_values()
     """
+    key = (id(item_lookup), id(property_lookup))
+    with shared_lock:
+        if key not in shared_values:
+            shared_values[key] = create_shared_values(item_lookup, property_lookup)
+        return shared_values[key]
 
-    logging.info("-------------------------next biobrick-------------------------")
+
+def WDI_statements(WDI_dict: dict, item_lookup: dict, property_lookup: dict) -> list:
+    """Creates the statements and aliases of the item page of a biobrick
+
+    :param WDI_dict: Containing data to be iterated and uploaded,
+    :param item_lookup: Wikibase item IDs.
+    :param property_lookup: Wikibase property IDs.
+
+    :return: list of list of Statement objects and list of aliases
+    """
 
     # sets label
     label = WDI_dict['part name']
-    logging.info("Parsing biobrick " + label)
 
     # statement holder for the biobrick page
     statements = []
     # holder for aliases
     aliases = []
 
-    # creating deep copies of references and qualifiers.
-    iGEM_ref = copy.deepcopy(create_iGEM_reference(WDI_dict['part name'], item_lookup, property_lookup))
-    Blast_ref = copy.deepcopy(create_blast_reference(item_lookup, property_lookup))
-    Biopython_ref = copy.deepcopy(create_biopython_reference(item_lookup, property_lookup))
-    datetime_qual = copy.deepcopy(create_datetime_qualifier(property_lookup))
+    # references and qualifiers, shared by all parts except for the iGEM reference
+    shared = get_shared_values(item_lookup, property_lookup)
+    iGEM_ref = iGEM_reference(WDI_dict['part name'], shared, property_lookup)
+    Blast_ref = shared["Blast_ref"]
+    Biopython_ref = shared["Biopython_ref"]
+    datetime_qual = shared["datetime_qual"]
 
     # instance of biobrick is a conserved statement
-    statements.append(wdi_core.WDItemID(
+    statements.append(Statement(
         value=item_lookup['Biobrick'],
         prop_nr=property_lookup['instance of'],
+        datatype="wikibase-item",
         references=[iGEM_ref]))
 
     # parsing the WDI dictionary and iterating and creating statements of each of the items.
@@ -66,20 +80,20 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
         # description
         if key == 'description':
             logging.info("Parsing description")
-            description = value
 
         # part name
         elif key == 'part name':
             logging.info("Parsing iGem Parts Identifier")
-            statements.append(wdi_core.WDExternalID(
+            statements.append(Statement(
                 value=WDI_dict[key],
                 prop_nr=property_lookup['iGem Parts ID'],
+                datatype="external-id",
                 references=[iGEM_ref]))
 
         # long description
         elif key == 'long description':
             logging.info("Parsing long description")
-            statements.append(wdi_core.WDString(
+            statements.append(Statement(
                 value=value,
                 prop_nr=property_lookup['long description'],
                 references=[iGEM_ref]))
@@ -91,17 +105,9 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
         # sequence and sequence length (+URL)
         elif key == 'sequence_length':
             logging.info("Parsing sequence")
-            qual_list = []
-            sl_qual_list = []
-
-            sl_qual_list.append(wdi_core.WDString(
-                value=str(value),
-                prop_nr=property_lookup['sequence length'],
-                is_qualifier=True))
-
-            qual_list = sl_qual_list.append(datetime_qual)
+            qual_list = [Snak(property_lookup['sequence length'], str(value)), datetime_qual]
 
-            statements.append(wdi_core.WDString(
+            statements.append(Statement(
                 value="http://parts.igem.org/cgi/partsdb/composite_edit/putseq.cgi?part=" + label,
                 prop_nr=property_lookup['sequence'],
                 references=[iGEM_ref],
@@ -111,7 +117,7 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
         elif key == 'authors':
             logging.info("Parsing author")
             for author in value:
-                statements.append(wdi_core.WDString(
+                statements.append(Statement(
                     value=author.strip(),
                     prop_nr=property_lookup['author'],
                     references=[iGEM_ref]))
@@ -120,14 +126,13 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
         elif key == 'RS_dict':
             logging.info("Parsing RS_dict")
             for key2, value2 in value.items():
-                print(key2, value2)
-                RS_qual_list = create_RS_qualifier(value2, property_lookup)
-                print(RS_qual_list)
+                RS_qual_list = RS_qualifiers(value2, property_lookup)
 
                 statements.append(
-                    wdi_core.WDItemID(
+                    Statement(
                         value=item_lookup[str(key2)],
                         prop_nr=property_lookup['restriction site'],
+                        datatype="wikibase-item",
                         references=[iGEM_ref, Biopython_ref],
                         qualifiers=RS_qual_list
                     )
@@ -138,8 +143,9 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
             logging.info("Parsing assembly compatibilities")
             for AS in value:
                 item = str(item_lookup[AS])
-                statements.append(wdi_core.WDItemID(
+                statements.append(Statement(
                     value=item, prop_nr=property_lookup['Compatible with'],
+                    datatype="wikibase-item",
                     references=[Biopython_ref],
                     qualifiers=[datetime_qual]))
 
@@ -148,18 +154,20 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
             logging.info("Parsing assembly incompatibilities")
             for AS in value:
                 item = str(item_lookup[AS])
-                statements.append(wdi_core.WDItemID(
+                statements.append(Statement(
                     value=item,
                     prop_nr=property_lookup['Incompatible with'],
+                    datatype="wikibase-item",
                     references=[Biopython_ref],
                     qualifiers=[datetime_qual]))
 
         # part type
         elif key == 'part type':
             logging.info("Parsing part type " + value)
-            statements.append(wdi_core.WDItemID(
+            statements.append(Statement(
                 value=item_lookup[value],
                 prop_nr=property_lookup['part type'],
+                datatype="wikibase-item",
                 references=[iGEM_ref]))
 
         # UniProt_hit creates statement with qualifiers
@@ -173,58 +181,37 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
 
                 # UniProt name
                 if key2 == 'uniprot name':
-                    qual_list.append(wdi_core.WDExternalID(
-                        value=value2,
-                        prop_nr=property_lookup['UniProt name'],
-                        is_qualifier=True))
+                    qual_list.append(Snak(property_lookup['UniProt name'], value2, "external-id"))
 
                 # EC number
                 elif key2 == 'EC number':
-                    qual_list.append(wdi_core.WDExternalID(
-                        value=value2,
-                        prop_nr=property_lookup['EC number'],
-                        is_qualifier=True))
+                    qual_list.append(Snak(property_lookup['EC number'], value2, "external-id"))
 
                 # KO number
                 elif key2 == 'ko':
-                    qual_list.append(wdi_core.WDExternalID(
-                        value=value2,
-                        prop_nr=property_lookup['KO number'],
-                        is_qualifier=True))
+                    qual_list.append(Snak(property_lookup['KO number'], value2, "external-id"))
 
                 # organism
                 elif key2 == 'organism':
-                    qual_list.append(wdi_core.WDString(
-                        value=value2,
-                        prop_nr=property_lookup['Organism'],
-                        is_qualifier=True))
+                    qual_list.append(Snak(property_lookup['Organism'], value2))
 
                 # UniProt protein ID
                 elif key2 == 'Hit_accession':
-                    qual_list.append(wdi_core.WDExternalID(
-                        value=value2,
-                        prop_nr=property_lookup['UniProt protein ID'],
-                        is_qualifier=True))
+                    qual_list.append(Snak(property_lookup['UniProt protein ID'], value2, "external-id"))
 
                 # Expect Value
                 elif key2 == 'Hsp_evalue':
-                    qual_list.append(wdi_core.WDString(
-                        value=str(value2),
-                        prop_nr=property_lookup['Expect Value'],
-                        is_qualifier=True))
+                    qual_list.append(Snak(property_lookup['Expect Value'], str(value2)))
 
                 # Bit Score
                 elif key2 == 'Hsp_bit-score':
-                    qual_list.append(wdi_core.WDString(
-                        value=str(value2),
-                        prop_nr=property_lookup['Bit Score'],
-                        is_qualifier=True))
+                    qual_list.append(Snak(property_lookup['Bit Score'], str(value2)))
 
                 else:
                     pass
 
             # Alignment hit number
-            statements.append(wdi_core.WDString(
+            statements.append(Statement(
                 value=str(WDI_dict['UniProt dict']['Hit_nmr']),
                 prop_nr=property_lookup['Alignment'],
                 references=[Blast_ref],
@@ -234,16 +221,17 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
         # status
         elif key == "status":
             logging.info("Parsing status")
-            statements.append(wdi_core.WDItemID(
+            statements.append(Statement(
                 value=item_lookup[value],
                 prop_nr=property_lookup["Status"],
+                datatype="wikibase-item",
                 references=[iGEM_ref],
                 qualifiers=[datetime_qual]))
 
         # part ID
         elif key == 'part_id':
             aliases.append(str(value))
-            statements.append(wdi_core.WDString(
+            statements.append(Statement(
                 value=str(value),
                 prop_nr=property_lookup["part ID"],
                 references=[iGEM_ref],
@@ -256,50 +244,72 @@ def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
         else:
             logging.info("skipped " + key)
 
-    # finding parts page
-    parts_page_identifier = get_item_by_name(WDI_dict['part name'], endpoint_url)
+    return [statements, aliases]
 
-    # if parts page present, update and not write.
-    if parts_page_identifier is not None:
-        logging.info("Part " + label + " " + parts_page_identifier.strip(
-            "Q") + " already exists, writing update")
 
-        parts_page = wdi_core.WDItemEngine(
-            wd_item_id=parts_page_identifier,
-            new_item=False,
-            data=statements,
-            mediawiki_api_url=mediawiki_api_url,
-            sparql_endpoint_url=endpoint_url)
+def WDI_writer(WDI_dict: dict, item_lookup: dict, property_lookup: dict,
+               login_instance, endpoint_url: str, mediawiki_api_url: str, label_lookup: dict = None,
+               fingerprints=None):
+    """Creates statements for the iterated dictionary and creates an item page is this is not already present.
+    Otherwise updates the item page.
+
+    :param WDI_dict: Containing data to be iterated and uploaded,
+    :param item_lookup: Wikibase item IDs.
+    :param property_lookup: Wikibase property IDs.
+    :param login_instance: login instance of the Wikibase bot.
+    :param endpoint_url: SPARQL endpoint of Wikibase.
+    :param mediawiki_api_url: API of Wikibase.
+    :param label_lookup: Wikibase item IDs by label, created by get_label_index(). Updated with created items.
+        If None the item page is searched by a query.
+    :param fingerprints: SQLiteCache of statement fingerprints per part name. Existing item pages whose statements
+        did not change since the last successful write are skipped. If None every item page is written.
+    """
 
-        if len(description) > 1:
-            parts_page.set_description(description=description, lang="en")
-        else:
-            pass
+    logging.info("-------------------------next biobrick-------------------------")
 
-        parts_page.set_aliases(aliases=aliases, lang="en", append=False)
+    # sets label
+    label = WDI_dict['part name']
+    logging.info("Parsing biobrick " + label)
 
-        print(parts_page.wd_json_representation)
-        parts_page.write(login_instance)
-        logging.info("part " + label + " page is updated")
+    # description, only set if present
+    description = WDI_dict.get('description', "")
+
+    # creates the statements
+    [statements, aliases] = WDI_statements(WDI_dict, item_lookup, property_lookup)
 
+    # finding parts page
+    if label_lookup is not None:
+        parts_page_identifier = label_lookup.get(WDI_dict['part name'])
     else:
-        parts_page = wdi_core.WDItemEngine(
-            new_item=True,
-            data=statements,
-            mediawiki_api_url=mediawiki_api_url,
-            sparql_endpoint_url=endpoint_url)
+        parts_page_identifier = get_item_by_name(WDI_dict['part name'], endpoint_url)
 
-        parts_page.set_label(label=label, lang="en")
+    # skips the parts page if the statements did not change since the last write
+    if fingerprints is not None:
+        fingerprint = statement_fingerprint(statements, [property_lookup['retrieved']], label,
+                                            WDI_dict.get('description', ""), aliases)
+        if parts_page_identifier is not None and fingerprints.get(label) == fingerprint:
+            logging.info("part " + label + " is unchanged, skipping")
+            return
 
-        # checks if description is present, then adds discription
-        if len(description) > 1:
-            parts_page.set_description(description=description, lang="en")
-        else:
-            pass
-
-        parts_page.set_aliases(aliases=aliases, lang="en")
+    # if parts page present, update and not write.
+    if parts_page_identifier is not None:
+        logging.info("Part " + label + " " + parts_page_identifier.strip(
+            "Q") + " already exists, writing update")
 
-        print(parts_page.wd_json_representation)
+        write_entity(statements, login_instance, mediawiki_api_url, item_id=parts_page_identifier,
+                     description=description if len(description) > 1 else None, aliases=aliases)
+        logging.info("part " + label + " page is updated")
 
-        parts_page.write(login_instance)
+    else:
+        parts_page_identifier = write_entity(statements, login_instance, mediawiki_api_url, label=label,
+                                             description=description if len(description) > 1 else None,
+                                             aliases=aliases)
         logging.info("part " + label + " page is created")
+
+        # adds the created item page to the label index
+        if label_lookup is not None:
+            label_lookup[label] = parts_page_identifier
+
+    # stores the fingerprint after the successful write
+    if fingerprints is not None:
+        fingerprints.set(label, fingerprint)
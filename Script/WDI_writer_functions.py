@@ -5,6 +5,11 @@ import os
 from wikidataintegrator import wdi_core, wdi_login
 import logging
 import pickle
+import json
+import hashlib
+import time
+import requests
+from Http_functions import get_http_client
 
 __author__ = "Riemer van der Vliet"
 __copyright__ = "Copyright 2020, Laboratory of Systems and Synthetic Biology"
@@ -133,13 +138,17 @@ def get_properties(endpoint_url: str) -> dict:
         """
 
     # get results
-    results = wdi_core.WDItemEngine.execute_sparql_query(query=query, endpoint=endpoint_url)
+    results = get_http_client().sparql_query(endpoint_url, query)
 
     # parse results
     for result in results["results"]["bindings"]:
         label = result["label"]["value"].split("/")[-1]
         property_lookup[label] = result["property"]["value"].split("/")[-1]
 
+    # dumps object as pickle file, used by the offline export
+    with open('../Parts/property_lookup.pickle', 'wb') as handle:
+        pickle.dump(property_lookup, handle, protocol=pickle.DEFAULT_PROTOCOL)
+
     return property_lookup
 
 
@@ -160,11 +169,18 @@ def get_items(items: list, endpoint_url: str) -> dict:
     else:
         item_lookup = {}
 
-    # iterates items and gets the item ID by name
-    for item_x in items:
-        logging.info("Retrieving item " + item_x)
-        if item_x in item_lookup: continue
-        item_lookup[item_x] = get_item_by_name(item_x, endpoint_url)
+    # gets the item IDs of the items not in the pickle file by name, concurrently
+    missing = [item_x for item_x in items if item_x not in item_lookup]
+    if missing:
+        logging.info("Retrieving items " + ", ".join(missing))
+    try:
+        results = get_http_client().sparql_many(endpoint_url, [item_name_query(item_x) for item_x in missing])
+    except Exception as error:
+        logging.warning("Query failed: " + repr(error))
+        raise
+
+    for item_x, result in zip(missing, results):
+        item_lookup[item_x] = item_name_parse(result)
 
     # dumps object as pickle file
     with open('../Parts/item_lookup.pickle', 'wb') as handle:
@@ -182,21 +198,278 @@ def get_item_by_name(label: str, endpoint_url: str) -> str or bool:
     :return: result string of wikibase ID or None
     """
 
-    # sets query
+    # gets results
+    try:
+        results = get_http_client().sparql_query(endpoint_url, item_name_query(label))
+    except Exception as error:
+        logging.warning("Query failed: " + repr(error))
+        raise
+
+    return item_name_parse(results)
+
+
+def item_name_query(label: str) -> str:
+    """Creates the query of the item ID by label
+
+    :param label: Item label
+
+    :return: SPARQL query
+    """
     query = """
     SELECT DISTINCT ?item WHERE { 
       VALUES ?label { \"""" + label + """\"@en }
       ?item rdfs:label ?label .
     }"""
+    return query
 
-    # gets results
-    try:
-        results = wdi_core.WDItemEngine.execute_sparql_query(query, endpoint=endpoint_url)
-    except:
-        print("Query failed: ")
-        raise Exception("Query failed")
+
+def item_name_parse(results: dict) -> str or None:
+    """Parses the results of item_name_query()
+
+    :param results: SPARQL JSON results
+
+    :return: result string of wikibase ID or None
+    """
 
     # iterates results
     for result in results["results"]["bindings"]:
         return result["item"]["value"].split("/")[-1]
     return None
+
+
+def get_label_index(endpoint_url: str, page_size: int = 50000, pages: int = 4) -> dict:
+    """Retrieves the IDs of all items on the endpoint url by their English label using paginated queries. Used to
+    check whether an item page is present without a query per item.
+
+    :param endpoint_url: Wikibase SPARQL endpoint
+    :param page_size: number of results per query
+    :param pages: number of pages queried concurrently
+
+    :return: label_lookup dictionary of key item label and value item ID of Wikibase
+    """
+
+    # placeholder for dictionary
+    label_lookup = {}
+    offset = 0
+    last = False
+
+    while not last:
+        # sets queries of the next pages, ordered to make the pages stable
+        queries = ["""
+        SELECT ?item ?label WHERE {
+          ?item rdfs:label ?label .
+          FILTER (LANG(?label) = "en")
+        } ORDER BY ?item LIMIT """ + str(page_size) + """ OFFSET """ + str(offset + page * page_size)
+                   for page in range(pages)]
+
+        # gets results
+        try:
+            results_pages = get_http_client().sparql_many(endpoint_url, queries)
+        except Exception as error:
+            logging.warning("Query failed: " + repr(error))
+            raise
+
+        # iterates results in page order, properties are skipped
+        for results in results_pages:
+            bindings = results["results"]["bindings"]
+            for result in bindings:
+                item = result["item"]["value"].split("/")[-1]
+                if item.startswith("Q"):
+                    label_lookup.setdefault(result["label"]["value"], item)
+
+            # stops at the last page
+            if len(bindings) < page_size:
+                last = True
+                break
+
+        logging.info("Retrieved " + str(len(label_lookup)) + " item labels")
+        offset += pages * page_size
+
+    save_label_index(label_lookup)
+
+    return label_lookup
+
+
+def save_label_index(label_lookup: dict):
+    """Dumps the label index as pickle file, used by the offline export. Called again after the uploads, as the items
+    created by WDI_writer are only added to label_lookup in memory.
+
+    :param label_lookup: dictionary of key item label and value item ID of Wikibase, created by get_label_index()
+    """
+    with open('../Parts/label_lookup.pickle', 'wb') as handle:
+        pickle.dump(label_lookup, handle, protocol=pickle.DEFAULT_PROTOCOL)
+
+
+def statement_fingerprint(statements: list, volatile_props: list, label: str, description: str,
+                          aliases: list) -> str:
+    """Creates a content fingerprint of the statements of an item page. Qualifiers of volatile properties, such as
+    the retrieved date, are left out so the fingerprint only changes when the content changes.
+
+    :param statements: list of WDI objects
+    :param volatile_props: list of property IDs of qualifiers to be left out
+    :param label: item label
+    :param description: item description
+    :param aliases: list of item aliases
+
+    :return: SHA-1 hex digest of the statements
+    """
+
+    # placeholder for list
+    content = []
+
+    # iterates the JSON representation of the statements and removes the volatile qualifiers
+    for statement in statements:
+        statement_json = statement.get_json_representation()
+        qualifiers = {}
+        for prop, qualifier in statement_json.get("qualifiers", {}).items():
+            if prop not in volatile_props:
+                qualifiers[prop] = qualifier
+        content.append([statement_json.get("mainsnak"), qualifiers, statement_json.get("references", [])])
+
+    # the order of the statements is not relevant
+    content = sorted(json.dumps(statement, sort_keys=True) for statement in content)
+
+    return hashlib.sha1(json.dumps([label, description, aliases, content]).encode("utf8")).hexdigest()
+
+
+def mediawiki_api_call(payload: dict, login_instance, mediawiki_api_url: str, retries: int = 5) -> dict:
+    """Performs a call to the Wikibase API using the session of the login instance. Retries on connection errors,
+    timeouts, status 429 and 5xx and while the database replication lag is too high or the database is read only. An
+    expired edit token is renewed.
+
+    :param payload: API parameters
+    :param login_instance: login instance of the Wikibase bot.
+    :param mediawiki_api_url: API of Wikibase.
+    :param retries: number of retries
+
+    :return: JSON response
+    """
+    payload = dict(payload, format="json", maxlag=5)
+    for attempt in range(retries + 1):
+        last = attempt == retries
+        try:
+            response = login_instance.get_session().post(mediawiki_api_url, data=payload)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            if last:
+                raise
+            reason = repr(error)
+        else:
+            # client errors other than too many requests are not retried
+            if response.status_code >= 500 or response.status_code == 429:
+                if last:
+                    response.raise_for_status()
+                reason = "status " + str(response.status_code)
+            else:
+                response.raise_for_status()
+                json_data = response.json()
+
+                if "error" not in json_data:
+                    return json_data
+                code = json_data["error"].get("code")
+                if code not in ("maxlag", "readonly", "badtoken") or last:
+                    raise Exception("API error: " + json.dumps(json_data["error"]))
+                reason = code
+
+                # renews the edit token
+                if code == "badtoken" and "token" in payload:
+                    login_instance.generate_edit_credentials()
+                    payload["token"] = login_instance.get_edit_token()
+                    logging.info("badtoken, retrying with a new edit token")
+                    continue
+
+        # waits before retrying, longer each attempt
+        logging.info("API call failed, retrying: " + reason)
+        time.sleep(5 * (attempt + 1))
+
+
+def get_entity_claims(item_id: str, login_instance, mediawiki_api_url: str) -> dict:
+    """Retrieves the statements of an item page
+
+    :param item_id: Wikibase item ID
+    :param login_instance: login instance of the Wikibase bot.
+    :param mediawiki_api_url: API of Wikibase.
+
+    :return: dictionary with key property ID and value list of statement dictionaries
+    """
+    json_data = mediawiki_api_call({"action": "wbgetentities", "ids": item_id, "props": "claims"}, login_instance,
+                                   mediawiki_api_url)
+    return json_data["entities"][item_id].get("claims", {})
+
+
+def merge_claims(statements: list, existing: dict) -> list:
+    """Creates the claims of wbeditentity. Statements of the written properties replace the present statements of
+    these properties, present statements with the same value are updated in place and the others are removed.
+    Statements of other properties are not changed.
+
+    :param statements: list of Statement objects
+    :param existing: present statements, created by get_entity_claims()
+
+    :return: list of claim dictionaries
+    """
+
+    # placeholder for list and for present statements per property and value
+    claims = []
+    present = {}
+    for statement in statements:
+        if statement.prop_nr not in present:
+            present[statement.prop_nr] = [claim for claim in existing.get(statement.prop_nr, [])
+                                          if "id" in claim]
+
+    # reuses the ID of a present statement with the same value
+    for statement in statements:
+        claim = statement.get_json_representation()
+        datavalue = statement.mainsnak.json["datavalue"]
+        for old in present[statement.prop_nr]:
+            if old["mainsnak"].get("datavalue") == datavalue:
+                claim = dict(claim, id=old["id"])
+                present[statement.prop_nr].remove(old)
+                break
+        claims.append(claim)
+
+    # removes the remaining present statements of the written properties
+    for old_claims in present.values():
+        for old in old_claims:
+            claims.append({"id": old["id"], "remove": ""})
+
+    return claims
+
+
+def write_entity(statements: list, login_instance, mediawiki_api_url: str, item_id: str = None, label: str = None,
+                 description: str = None, aliases: list = None) -> str:
+    """Writes the statements to an item page using wbeditentity, creates the item page if item_id is None.
+
+    :param statements: list of Statement objects
+    :param login_instance: login instance of the Wikibase bot.
+    :param mediawiki_api_url: API of Wikibase.
+    :param item_id: Wikibase item ID of the present item page or None
+    :param label: English label, only set on new item pages
+    :param description: English description, not set if None
+    :param aliases: English aliases, replacing the present aliases, not set if empty
+
+    :return: Wikibase item ID
+    """
+
+    # placeholder for dictionary
+    data = {}
+
+    if item_id is None:
+        data["claims"] = [statement.get_json_representation() for statement in statements]
+        if label is not None:
+            data["labels"] = {"en": {"language": "en", "value": label}}
+    else:
+        data["claims"] = merge_claims(statements, get_entity_claims(item_id, login_instance, mediawiki_api_url))
+
+    if description is not None:
+        data["descriptions"] = {"en": {"language": "en", "value": description}}
+    if aliases:
+        data["aliases"] = {"en": [{"language": "en", "value": alias} for alias in aliases]}
+
+    payload = {"action": "wbeditentity", "data": json.dumps(data), "token": login_instance.get_edit_token(),
+               "bot": True}
+    if item_id is None:
+        payload["new"] = "item"
+    else:
+        payload["id"] = item_id
+
+    json_data = mediawiki_api_call(payload, login_instance, mediawiki_api_url)
+    return json_data["entity"]["id"]